@@ -0,0 +1,141 @@
+#! /usr/bin/env python3
+"""Check that importing entry points stays within a time budget.
+
+Each import statement is run in a fresh interpreter with ``python -X
+importtime``; the cumulative time of the imported modules is read from its
+output, minus that of the modules imported at interpreter startup, and the
+best of `--repeat` runs is compared to the budget. Exits with status 1 if
+any import is over budget.
+
+The budgets are checked by tests/test_import_time.py (and those of the
+repository's scripts by ../scripts/tests/test_script_imports.py) when pytest
+is run with ``-m import_time``. By default, the tests only check that the
+imports do not load `HEAVY_MODULES`, which does not depend on the machine.
+
+Example:
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py -b "import utils=100" -p ../scripts
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# import statement -> budget in milliseconds. Extraction does not need pandas
+# nor multiprocessing, which alone take several hundred milliseconds.
+DEFAULT_BUDGETS = {
+    "import scanning_horizon": 50,
+    "from scanning_horizon import n_participants_from_texts": 150,
+    "from scanning_horizon import iter_n_participants_from_labelbuddy_docs": (
+        150
+    ),
+}
+# modules that the import statements must not import: alone, each of them
+# takes tens to hundreds of milliseconds.
+HEAVY_MODULES = ("pandas", "matplotlib", "numpy", "multiprocessing")
+
+
+def _env(python_path):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [*python_path, *filter(None, [env.get("PYTHONPATH")])]
+    )
+    return env
+
+
+def imported_modules(statement, modules=HEAVY_MODULES, python_path=()):
+    """Those of `modules` found in sys.modules after running `statement`."""
+    code = "{}\nimport sys\nprint(*[m for m in {!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code.format(statement, tuple(modules))],
+        env=_env(python_path),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def import_time_ms(statement, python_path=()):
+    """Total time spent importing modules (not found in sys.modules) in ms."""
+    # with -S `site` (whose import time would otherwise count) is not
+    # imported, so site-packages are added to the path explicitly
+    setup = "import sys; sys.path.extend({!r}); ".format(
+        [p for p in sys.path if p]
+    )
+    result = subprocess.run(
+        [sys.executable, "-S", "-X", "importtime", "-c", setup + statement],
+        env=_env(python_path),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # only top-level entries: nested imports are already included in
+        # the cumulative time of the module that triggered them
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+def check(budgets, repeat=5, python_path=()):
+    startup_ms = min(
+        import_time_ms("pass", python_path) for _ in range(repeat)
+    )
+    rows, over_budget = [], []
+    for statement, budget_ms in budgets.items():
+        time_ms = (
+            min(import_time_ms(statement, python_path) for _ in range(repeat))
+            - startup_ms
+        )
+        rows.append((statement, time_ms, budget_ms))
+        if time_ms > budget_ms:
+            over_budget.append(statement)
+    return rows, over_budget
+
+
+def _parse_budget(budget):
+    statement, _, budget_ms = budget.rpartition("=")
+    return statement.strip(), float(budget_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-b",
+        "--budget",
+        help="'<import statement>=<milliseconds>'; can be repeated. "
+        "Replaces the default budgets.",
+        type=_parse_budget,
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        help="Directory to add to PYTHONPATH; can be repeated.",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="Number of runs; the fastest is kept. Default is 5.",
+        type=int,
+        default=5,
+    )
+    args = parser.parse_args()
+
+    budgets = dict(args.budget) if args.budget else DEFAULT_BUDGETS
+    rows, over_budget = check(budgets, args.repeat, args.path)
+    width = max(len(statement) for statement, _, _ in rows)
+    print(f"{'import':<{width}}  {'ms':>8}  {'budget':>8}")
+    for statement, time_ms, budget_ms in rows:
+        print(f"{statement:<{width}}  {time_ms:>8.1f}  {budget_ms:>8.0f}")
+    if over_budget:
+        print(f"\nOver budget: {', '.join(over_budget)}")
+        sys.exit(1)
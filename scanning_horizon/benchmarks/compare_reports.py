@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+"""Compare two reports written by `run_benchmarks.py`.
+
+Prints the change in throughput (docs/s) and median latency for every
+benchmark present in both reports, and exits with status 1 if any
+throughput dropped by more than the tolerance.
+
+Example:
+    python benchmarks/compare_reports.py bench_before.json bench_after.json
+"""
+import argparse
+import json
+import pathlib
+import sys
+
+
+def compare(old_report, new_report, tolerance):
+    old_results, new_results = old_report["results"], new_report["results"]
+    rows, regressions = [], []
+    for name in old_results.keys() & new_results.keys():
+        old, new = old_results[name], new_results[name]
+        ratio = new["docs_per_sec"] / old["docs_per_sec"]
+        row = {
+            "benchmark": name,
+            "old_docs_per_sec": old["docs_per_sec"],
+            "new_docs_per_sec": new["docs_per_sec"],
+            "ratio": ratio,
+        }
+        if "latency_ms" in old and "latency_ms" in new:
+            row["old_p50_ms"] = old["latency_ms"]["p50"]
+            row["new_p50_ms"] = new["latency_ms"]["p50"]
+        rows.append(row)
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+    rows.sort(key=lambda row: row["benchmark"])
+    return rows, regressions
+
+
+def _print_rows(rows):
+    width = max((len(row["benchmark"]) for row in rows), default=10)
+    print(
+        f"{'benchmark':<{width}}  {'old docs/s':>12}  {'new docs/s':>12}  "
+        "ratio"
+    )
+    for row in rows:
+        print(
+            f"{row['benchmark']:<{width}}  {row['old_docs_per_sec']:>12.1f}  "
+            f"{row['new_docs_per_sec']:>12.1f}  {row['ratio']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old_report", type=str)
+    parser.add_argument("new_report", type=str)
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        help="Relative throughput drop above which a benchmark is "
+        "considered a regression. Default is 0.1 (10%%).",
+        type=float,
+        default=0.1,
+    )
+    args = parser.parse_args()
+
+    old_report = json.loads(pathlib.Path(args.old_report).read_text("UTF-8"))
+    new_report = json.loads(pathlib.Path(args.new_report).read_text("UTF-8"))
+    if old_report["config"] != new_report["config"]:
+        print(
+            "Warning: the reports were produced with different settings: "
+            f"{old_report['config']} vs {new_report['config']}",
+            file=sys.stderr,
+        )
+    rows, regressions = compare(old_report, new_report, args.tolerance)
+    _print_rows(rows)
+    if regressions:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        sys.exit(1)
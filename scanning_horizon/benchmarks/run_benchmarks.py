@@ -0,0 +1,234 @@
+#! /usr/bin/env python3
+"""Measure the throughput of the sample-size extractors.
+
+Runs each extractor on deterministic synthetic corpora (see
+`synthetic_corpus.py`) and writes a JSON report with docs/s, MB/s,
+per-document latency percentiles and peak (Python-allocated) memory. Two
+reports can be compared with `compare_reports.py`.
+
+Example:
+    python benchmarks/run_benchmarks.py -o bench_before.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import pathlib
+import platform
+import sys
+import time
+import tracemalloc
+
+from scanning_horizon import (
+    SampleSizeExtractor,
+    _get_ns_sample_sizes,
+    _get_ns_sample_sizes_2020,
+    n_participants_from_labelbuddy_docs,
+    n_participants_from_texts,
+)
+
+import synthetic_corpus
+
+_EXTRACTOR = SampleSizeExtractor()
+_UNFILTERED_EXTRACTOR = SampleSizeExtractor(prefilter=False)
+
+# extractors called once per document: latency percentiles are reported
+PER_DOCUMENT = {
+    "estimate_n_2016": _get_ns_sample_sizes.estimate_n,
+    "estimate_n_2020": _get_ns_sample_sizes_2020.estimate_n,
+    "SampleSizeExtractor": _EXTRACTOR.extract,
+    "SampleSizeExtractor[prefilter=False]": _UNFILTERED_EXTRACTOR.extract,
+}
+
+
+def _batch_benchmarks(n_jobs):
+    benchmarks = {
+        "n_participants_from_texts[n_jobs=1]": (
+            "texts",
+            n_participants_from_texts,
+        ),
+        f"n_participants_from_texts[n_jobs={n_jobs}]": (
+            "texts",
+            lambda texts: n_participants_from_texts(texts, n_jobs=n_jobs),
+        ),
+        "n_participants_from_labelbuddy_docs[n_jobs=1]": (
+            "docs",
+            n_participants_from_labelbuddy_docs,
+        ),
+        f"n_participants_from_labelbuddy_docs[n_jobs={n_jobs}]": (
+            "docs",
+            lambda docs: n_participants_from_labelbuddy_docs(
+                docs, n_jobs=n_jobs
+            ),
+        ),
+    }
+    try:
+        import pandas as pd
+
+        from scanning_horizon import n_participants_from_series
+    except ImportError:
+        pass
+    else:
+        benchmarks["n_participants_from_series"] = (
+            "texts",
+            lambda texts: n_participants_from_series(pd.Series(texts)),
+        )
+    return benchmarks
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = (len(sorted_values) - 1) * q / 100
+    low = int(idx)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (
+        idx - low
+    )
+
+
+def _peak_memory_mb(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1e6
+
+
+def _summarize(n_docs, n_bytes, seconds, peak_memory_mb, latencies=None):
+    result = {
+        "n_docs": n_docs,
+        "mb": n_bytes / 1e6,
+        "seconds": seconds,
+        "docs_per_sec": n_docs / seconds,
+        "mb_per_sec": n_bytes / 1e6 / seconds,
+        "peak_memory_mb": peak_memory_mb,
+    }
+    if latencies is not None:
+        latencies = sorted(lat * 1000 for lat in latencies)
+        result["latency_ms"] = {
+            f"p{q}": _percentile(latencies, q) for q in (50, 90, 99)
+        }
+        result["latency_ms"]["max"] = latencies[-1]
+    return result
+
+
+def bench_per_document(func, texts, n_bytes, repeat):
+    best_latencies, best_total = None, float("inf")
+    for _ in range(repeat):
+        latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            func(text)
+            latencies.append(time.perf_counter() - start)
+        total = sum(latencies)
+        if total < best_total:
+            best_latencies, best_total = latencies, total
+    peak = _peak_memory_mb(lambda: [func(text) for text in texts])
+    return _summarize(len(texts), n_bytes, best_total, peak, best_latencies)
+
+
+def bench_batch(func, inputs, n_docs, n_bytes, repeat):
+    best_total = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(inputs)
+        best_total = min(best_total, time.perf_counter() - start)
+    peak = _peak_memory_mb(func, inputs)
+    return _summarize(n_docs, n_bytes, best_total, peak)
+
+
+def _n_bytes(texts):
+    return sum(len(text.encode("utf-8")) for text in texts)
+
+
+def run(args):
+    corpora = {
+        "abstracts": synthetic_corpus.generate_texts(
+            args.n_abstracts, "abstract", seed=args.seed
+        ),
+        "full_texts": synthetic_corpus.generate_texts(
+            args.n_full_texts, "full_text", seed=args.seed
+        ),
+    }
+    docs = synthetic_corpus.generate_labelbuddy_docs(
+        args.n_full_texts, seed=args.seed
+    )
+    results = {}
+    for corpus_name, texts in corpora.items():
+        n_bytes = _n_bytes(texts)
+        for name, func in PER_DOCUMENT.items():
+            key = f"{name}/{corpus_name}"
+            print(key, file=sys.stderr)
+            results[key] = bench_per_document(
+                func, texts, n_bytes, args.repeat
+            )
+    abstracts_bytes = _n_bytes(corpora["abstracts"])
+    docs_bytes = _n_bytes(d["text"] for d in docs)
+    for name, (input_kind, func) in _batch_benchmarks(args.n_jobs).items():
+        if input_kind == "texts":
+            key = f"{name}/abstracts"
+            inputs, n_bytes = corpora["abstracts"], abstracts_bytes
+        else:
+            key = f"{name}/labelbuddy_docs"
+            inputs, n_bytes = docs, docs_bytes
+        print(key, file=sys.stderr)
+        results[key] = bench_batch(
+            func, inputs, len(inputs), n_bytes, args.repeat
+        )
+    return {
+        "date": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "n_abstracts": args.n_abstracts,
+            "n_full_texts": args.n_full_texts,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "n_jobs": args.n_jobs,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        help="JSON file where to write the report. Default is "
+        "benchmark_<date>.json in the current working directory.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument("--n_abstracts", type=int, default=2000)
+    parser.add_argument("--n_full_texts", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat",
+        help="Number of timed runs; the fastest one is reported.",
+        type=int,
+        default=3,
+    )
+    parser.add_argument(
+        "--n_jobs",
+        help="Number of processes for the parallel batch benchmarks.",
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output_file is None:
+        output_file = pathlib.Path.cwd() / (
+            f"benchmark_{report['date'].replace(':', '-')}.json"
+        )
+    else:
+        output_file = pathlib.Path(args.output_file)
+    output_file.write_text(json.dumps(report, indent=2), "UTF-8")
+    print(output_file)
@@ -0,0 +1,120 @@
+"""Deterministic synthetic abstracts and full texts for benchmarks.
+
+The real corpus cannot be redistributed, so the benchmarks run on generated
+documents that resemble fMRI papers: filler sentences built from a fixed
+vocabulary, with sample-size mentions ("twenty-five healthy volunteers",
+"(n = 14)", ...) inserted at random. The same seed always gives the same
+corpus.
+"""
+import random
+
+_FILLER_WORDS = """
+the a of in and to with was were for by on during between functional
+connectivity activation cortex prefrontal amygdala hippocampus network default
+mode resting state task fmri bold signal response region analysis whole brain
+voxel cluster significant increased decreased compared relative associated
+correlation regression model effect group difference age sex behavioral
+performance memory attention reward emotion processing stimuli trials
+condition contrast scan session acquisition tesla scanner echo time repetition
+images preprocessing motion correction normalization smoothing statistical
+threshold corrected uncorrected results suggest findings indicate role these
+this that our we study previous literature evidence individual differences
+""".split()
+
+_POPULATIONS = [
+    "volunteers", "subjects", "individuals", "participants", "students",
+    "patients", "outpatients", "undergraduates", "adults", "controls",
+    "people", "stroke", "children",
+]
+
+_ADJECTIVES = [
+    "healthy", "right-handed", "young", "older", "adolescent", "elderly",
+    "typically-developing", "depressed", "schizophrenic", "native",
+]
+
+_NUMBER_WORDS = [
+    "twelve", "fifteen", "sixteen", "eighteen", "twenty", "twenty-one",
+    "twenty-four", "twenty-five", "thirty", "thirty-two", "forty", "fifty",
+]
+
+_SECTIONS = ["Introduction", "Methods", "Results", "Discussion"]
+
+
+def _sentence(rng, n_words):
+    words = rng.choices(_FILLER_WORDS, k=n_words)
+    return " ".join(words).capitalize() + "."
+
+
+def _sample_size_mention(rng):
+    kind = rng.randrange(4)
+    if kind == 0:
+        number = str(rng.randint(8, 300))
+    else:
+        number = rng.choice(_NUMBER_WORDS)
+    if kind == 1:
+        number = number.capitalize()
+    population = rng.choice(_POPULATIONS)
+    if kind == 3:
+        return f"{population} (n = {rng.randint(8, 300)})"
+    if rng.random() < 0.6:
+        return f"{number} {rng.choice(_ADJECTIVES)} {population}"
+    return f"{number} {population}"
+
+
+def _paragraph(rng, n_sentences, mention_rate):
+    sentences = []
+    for _ in range(n_sentences):
+        sentence = _sentence(rng, rng.randint(8, 30))
+        if rng.random() < mention_rate:
+            words = sentence.split()
+            words.insert(rng.randrange(len(words)), _sample_size_mention(rng))
+            sentence = " ".join(words)
+        sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def generate_abstract(rng):
+    return _paragraph(rng, rng.randint(6, 14), mention_rate=0.25)
+
+
+def generate_full_text(rng):
+    """Return (text, (abstract_start, abstract_end))."""
+    title = _sentence(rng, rng.randint(6, 15))
+    abstract = generate_abstract(rng)
+    parts = [f"# {title}\n\n## Abstract\n\n"]
+    abstract_start = len(parts[0])
+    parts.append(abstract)
+    abstract_end = abstract_start + len(abstract)
+    for section in _SECTIONS:
+        parts.append(f"\n\n## {section}\n\n")
+        for _ in range(rng.randint(3, 8)):
+            parts.append(_paragraph(rng, rng.randint(4, 10), 0.05) + "\n\n")
+    return "".join(parts), (abstract_start, abstract_end)
+
+
+def generate_texts(n_docs, kind="abstract", seed=0):
+    """List of `n_docs` texts; `kind` is "abstract" or "full_text"."""
+    rng = random.Random(seed)
+    if kind == "abstract":
+        return [generate_abstract(rng) for _ in range(n_docs)]
+    if kind == "full_text":
+        return [generate_full_text(rng)[0] for _ in range(n_docs)]
+    raise ValueError(f"Unknown kind: {kind!r}")
+
+
+def generate_labelbuddy_docs(n_docs, seed=0):
+    """Documents shaped like the labelbuddy JSONL documents."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        text, abstract_pos = generate_full_text(rng)
+        docs.append(
+            {
+                "text": text,
+                "metadata": {
+                    "pmcid": 1000000 + i,
+                    "field_positions": {"abstract": list(abstract_pos)},
+                },
+            }
+        )
+    return docs
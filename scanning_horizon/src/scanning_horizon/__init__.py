@@ -1,6 +1,48 @@
-from scanning_horizon._information_extraction import (
-    n_participants_from_labelbuddy_docs,
-    n_participants_from_texts,
-)
+import importlib
 
-__all__ = ["n_participants_from_labelbuddy_docs", "n_participants_from_texts"]
+# public name -> private module defining it. Modules are imported on first
+# attribute access (PEP 562), so that e.g. text extraction does not pay for
+# importing pandas, which only the Series API needs.
+_LAZY_ATTRIBUTES = {
+    "ExtractionCache": "_cache",
+    "MISSING": "_cache",
+    "text_hash": "_cache",
+    "iter_n_participants_from_labelbuddy_docs": "_information_extraction",
+    "iter_n_participants_from_texts": "_information_extraction",
+    "n_participants_from_labelbuddy_docs": "_information_extraction",
+    "n_participants_from_texts": "_information_extraction",
+    "SampleSizeExtractor": "_sample_size_extractor",
+    "n_participants_from_series": "_series",
+    "sample_size_matches_from_series": "_series",
+}
+
+__all__ = [
+    "ExtractionCache",
+    "MISSING",
+    "SampleSizeExtractor",
+    "iter_n_participants_from_labelbuddy_docs",
+    "iter_n_participants_from_texts",
+    "n_participants_from_labelbuddy_docs",
+    "n_participants_from_series",
+    "n_participants_from_texts",
+    "sample_size_matches_from_series",
+    "text_hash",
+]
+
+
+def __getattr__(name):
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}"
+        ) from None
+    value = getattr(
+        importlib.import_module(f"{__name__}.{module_name}"), name
+    )
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
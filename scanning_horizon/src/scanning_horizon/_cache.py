@@ -0,0 +1,197 @@
+import hashlib
+import json
+import pathlib
+import sqlite3
+import time
+
+# returned by `ExtractionCache.get` when the key is not in the cache (None is
+# a valid cached value: nothing was found in the text)
+MISSING = object()
+
+_SCHEMA = """
+create table if not exists extraction (
+    extractor text not null,
+    version text not null,
+    text_hash text not null,
+    value text not null,
+    size integer not null,
+    last_access real not null,
+    primary key (extractor, version, text_hash)
+);
+create index if not exists extraction_last_access
+on extraction (last_access);
+"""
+
+
+def text_hash(text):
+    """SHA-256 hex digest of a text, the key of its cached results."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Content-addressed cache of extraction results, stored in SQLite.
+
+    Results are keyed by the SHA-256 of the document text together with an
+    extractor name and version, so they are reused whenever the same text is
+    processed again by the same extractor, and ignored as soon as either
+    changes. Values must be JSON-serializable.
+
+    When the total size of the stored values exceeds `max_size_bytes`, the
+    least recently used entries are deleted.
+
+    The cache can be used from several threads, provided calls are
+    serialized by the caller (e.g. with a lock).
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        SQLite database file; created if it does not exist.
+    max_size_bytes : int
+        Size cap for the stored values.
+    """
+
+    def __init__(self, path, max_size_bytes=2 * 1024**3):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self._connection = sqlite3.connect(
+            str(self.path), timeout=60, check_same_thread=False
+        )
+        self._connection.execute("pragma journal_mode=wal")
+        self._connection.executescript(_SCHEMA)
+        self._n_pending_writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        raise TypeError(
+            f"{self.__class__.__name__} cannot be sent to other processes."
+        )
+
+    def get(self, extractor, version, text=None, *, key=None):
+        """Cached value for `text` (or its hash, `key`), or `MISSING`."""
+        if key is None:
+            key = text_hash(text)
+        row = self._connection.execute(
+            "select value from extraction "
+            "where extractor = ? and version = ? and text_hash = ?",
+            (extractor, version, key),
+        ).fetchone()
+        if row is None:
+            return MISSING
+        self._connection.execute(
+            "update extraction set last_access = ? "
+            "where extractor = ? and version = ? and text_hash = ?",
+            (time.time(), extractor, version, key),
+        )
+        self._count_write()
+        return json.loads(row[0])
+
+    def put(self, extractor, version, value, text=None, *, key=None):
+        if key is None:
+            key = text_hash(text)
+        value_json = json.dumps(value)
+        self._connection.execute(
+            "insert or replace into extraction values (?, ?, ?, ?, ?, ?)",
+            (
+                extractor,
+                version,
+                key,
+                value_json,
+                len(value_json),
+                time.time(),
+            ),
+        )
+        self._count_write()
+
+    def _count_write(self):
+        self._n_pending_writes += 1
+        if self._n_pending_writes >= 1000:
+            self.commit()
+
+    def commit(self):
+        self._connection.commit()
+        self._n_pending_writes = 0
+        self.evict()
+
+    def close(self):
+        self.commit()
+        self._connection.close()
+
+    def size_bytes(self):
+        return self._connection.execute(
+            "select coalesce(sum(size), 0) from extraction"
+        ).fetchone()[0]
+
+    def evict(self, max_size_bytes=None):
+        """Delete least recently used entries until under the size cap.
+
+        Returns the number of deleted entries.
+        """
+        if max_size_bytes is None:
+            max_size_bytes = self.max_size_bytes
+        excess = self.size_bytes() - max_size_bytes
+        if excess <= 0:
+            return 0
+        rows = self._connection.execute(
+            "select rowid, size from extraction order by last_access"
+        )
+        to_delete = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            to_delete.append((rowid,))
+            excess -= size
+        self._connection.executemany(
+            "delete from extraction where rowid = ?", to_delete
+        )
+        self._connection.commit()
+        return len(to_delete)
+
+    def evict_unused(self, max_age_seconds):
+        """Delete entries not accessed in the last `max_age_seconds`.
+
+        Returns the number of deleted entries.
+        """
+        n_deleted = self._connection.execute(
+            "delete from extraction where last_access < ?",
+            (time.time() - max_age_seconds,),
+        ).rowcount
+        self._connection.commit()
+        return n_deleted
+
+    def clear(self, extractor=None, version=None):
+        """Delete all entries, or those of one extractor (and version).
+
+        Returns the number of deleted entries.
+        """
+        query, params = "delete from extraction", []
+        if extractor is not None:
+            query += " where extractor = ?"
+            params.append(extractor)
+            if version is not None:
+                query += " and version = ?"
+                params.append(version)
+        n_deleted = self._connection.execute(query, params).rowcount
+        self._connection.commit()
+        return n_deleted
+
+    def stats(self):
+        """Number of entries and total size for each extractor and version."""
+        rows = self._connection.execute(
+            "select extractor, version, count(*), sum(size) from extraction "
+            "group by extractor, version order by extractor, version"
+        )
+        return [
+            {
+                "extractor": extractor,
+                "version": version,
+                "n_entries": n_entries,
+                "size_bytes": size,
+            }
+            for extractor, version, n_entries, size in rows
+        ]
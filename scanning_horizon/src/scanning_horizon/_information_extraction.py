@@ -1,20 +1,180 @@
-from scanning_horizon import _get_ns_sample_sizes
-
-
-def n_participants_from_labelbuddy_docs(documents):
-    texts = []
-    for doc in documents:
-        abs_start, abs_end = doc["metadata"]["field_positions"]["abstract"]
-        texts.append(doc["text"][abs_start:abs_end])
-    return n_participants_from_texts(texts)
-
-
-def n_participants_from_texts(article_texts):
-    result = []
-    for text in article_texts:
-        groups = _get_ns_sample_sizes.estimate_n(text)
-        if not groups:
-            result.append(None)
-        else:
-            result.append(sum((g[1] for g in groups)))
-    return result
+import collections
+import itertools
+import os
+
+from scanning_horizon._cache import MISSING, text_hash
+from scanning_horizon._sample_size_extractor import SampleSizeExtractor
+
+_DEFAULT_EXTRACTOR = SampleSizeExtractor()
+
+# extractor used by the current worker process, set by `_init_worker`
+_worker_extractor = None
+
+
+def n_participants_from_labelbuddy_docs(
+    documents, extractor=None, n_jobs=1, chunksize=500, cache=None
+):
+    return [
+        n
+        for _, n in iter_n_participants_from_labelbuddy_docs(
+            documents,
+            extractor=extractor,
+            n_jobs=n_jobs,
+            chunksize=chunksize,
+            cache=cache,
+        )
+    ]
+
+
+def n_participants_from_texts(
+    article_texts, extractor=None, n_jobs=1, chunksize=500, cache=None
+):
+    """Total number of participants in each text (None if not found).
+
+    With `n_jobs` > 1 (or negative, -1 meaning all CPUs), texts are sent in
+    batches of `chunksize` to a pool of worker processes; results are
+    returned in the order of `article_texts`. Inputs that fit in a single
+    batch are processed in the current process.
+
+    If an `ExtractionCache` is provided, texts already processed by the same
+    extractor are not processed again, and new results are added to it.
+    """
+    return list(
+        iter_n_participants_from_texts(
+            article_texts,
+            extractor=extractor,
+            n_jobs=n_jobs,
+            chunksize=chunksize,
+            cache=cache,
+        )
+    )
+
+
+def iter_n_participants_from_labelbuddy_docs(
+    documents, extractor=None, n_jobs=1, chunksize=500, cache=None
+):
+    """Yield (pmcid, n_participants) for each document, from its abstract.
+
+    `documents` can be any iterable, e.g. a generator reading a JSONL file:
+    documents are consumed as results are requested. Sequentially, only one
+    document is held at a time; with `n_jobs` > 1, at most `2 * n_jobs`
+    batches of `chunksize` abstracts are in flight.
+    """
+    abstracts = (
+        (doc["metadata"].get("pmcid"), _get_abstract(doc)) for doc in documents
+    )
+    return _iter_n_participants(
+        abstracts, extractor, n_jobs, chunksize, cache
+    )
+
+
+def iter_n_participants_from_texts(
+    article_texts, extractor=None, n_jobs=1, chunksize=500, cache=None
+):
+    """Yield the total number of participants (or None) for each text."""
+    for _, n in _iter_n_participants(
+        enumerate(article_texts), extractor, n_jobs, chunksize, cache
+    ):
+        yield n
+
+
+def _get_abstract(doc):
+    abs_start, abs_end = doc["metadata"]["field_positions"]["abstract"]
+    return doc["text"][abs_start:abs_end]
+
+
+def _iter_n_participants(keyed_texts, extractor, n_jobs, chunksize, cache):
+    if extractor is None:
+        extractor = _DEFAULT_EXTRACTOR
+    if cache is not None:
+        yield from _iter_cached_n_participants(
+            keyed_texts, extractor, n_jobs, chunksize, cache
+        )
+        return
+    n_jobs = _effective_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for key, text in keyed_texts:
+            yield key, extractor.n_participants(text)
+        return
+    batches = _batches(keyed_texts, chunksize)
+    first_batches = list(itertools.islice(batches, 2))
+    if len(first_batches) < 2:
+        for key, text in itertools.chain(*first_batches):
+            yield key, extractor.n_participants(text)
+        return
+    # imported here because it is slow to import and only needed when
+    # running in parallel
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        n_jobs, initializer=_init_worker, initargs=(extractor,)
+    ) as executor:
+        pending = collections.deque()
+        for batch in itertools.chain(first_batches, batches):
+            pending.append(executor.submit(_n_participants_batch, batch))
+            if len(pending) >= 2 * n_jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _iter_cached_n_participants(
+    keyed_texts, extractor, n_jobs, chunksize, cache
+):
+    extractor_name, extractor_version = extractor.cache_id
+    # (key, text hash, cached value or MISSING), in input order
+    pending = collections.deque()
+
+    def cache_misses():
+        for key, text in keyed_texts:
+            hash_ = text_hash(text)
+            value = cache.get(extractor_name, extractor_version, key=hash_)
+            pending.append((key, hash_, value))
+            if value is MISSING:
+                yield key, text
+
+    # results come in the order of the misses; any entry before the next
+    # miss in `pending` is a cache hit.
+    for key, n in _iter_n_participants(
+        cache_misses(), extractor, n_jobs, chunksize, None
+    ):
+        while pending[0][2] is not MISSING:
+            hit_key, _, value = pending.popleft()
+            yield hit_key, value
+        _, hash_, _ = pending.popleft()
+        cache.put(extractor_name, extractor_version, n, key=hash_)
+        yield key, n
+    for hit_key, _, value in pending:
+        yield hit_key, value
+    cache.commit()
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _effective_n_jobs(n_jobs):
+    if n_jobs is None:
+        return 1
+    if n_jobs == 0:
+        raise ValueError("n_jobs == 0 has no meaning.")
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def _init_worker(extractor):
+    global _worker_extractor
+    _worker_extractor = extractor
+
+
+def _n_participants_batch(keyed_texts):
+    return [
+        (key, _worker_extractor.n_participants(text))
+        for key, text in keyed_texts
+    ]
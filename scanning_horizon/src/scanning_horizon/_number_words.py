@@ -0,0 +1,58 @@
+"""Numbers written in words, such as "twenty-five" or "fourth".
+
+`words_to_int` gives the same results as `_get_ns_sample_sizes.text2int` but
+all the word forms it accepts (including ordinals) are computed once, at
+import time, so that recognizing a word is a single dictionary lookup and
+words that are not numbers return None instead of raising an exception.
+"""
+
+
+def _build_word_values():
+    units = [
+        "zero", "one", "two", "three", "four", "five", "six", "seven",
+        "eight", "nine", "ten", "eleven", "twelve", "thirteen", "fourteen",
+        "fifteen", "sixteen", "seventeen", "eighteen", "nineteen",
+    ]
+    tens = ["", "", "twenty", "thirty", "forty",
+            "fifty", "sixty", "seventy", "eighty", "ninety"]
+    scales = ["hundred", "thousand", "million", "billion", "trillion"]
+    ordinal_words = {"first": 1, "second": 2, "third": 3,
+                     "fifth": 5, "eighth": 8, "ninth": 9, "twelfth": 12}
+
+    # cardinals, with the same (scale, increment) values as text2int; note
+    # that text2int maps the empty string (and therefore "th") to 10.
+    numwords = {}
+    for idx, word in enumerate(units):
+        numwords[word] = (1, idx)
+    for idx, word in enumerate(tens):
+        numwords[word] = (1, idx * 10)
+    for idx, word in enumerate(scales):
+        numwords[word] = (10 ** (idx * 3 or 2), 0)
+
+    # ordinals: text2int strips "ieth" -> "y", then "th" -> ""
+    word_values = dict(numwords)
+    for word, value in numwords.items():
+        word_values[f"{word}th"] = value
+        if word.endswith("y"):
+            word_values[f"{word[:-1]}ieth"] = value
+    for word, increment in ordinal_words.items():
+        word_values[word] = (1, increment)
+    return word_values
+
+
+_WORD_VALUES = _build_word_values()
+
+
+def words_to_int(text):
+    """Integer value of a lowercase number in words, or None."""
+    current = result = 0
+    for word in text.replace("-", " ").split():
+        value = _WORD_VALUES.get(word)
+        if value is None:
+            return None
+        scale, increment = value
+        current = current * scale + increment
+        if scale > 100:
+            result += current
+            current = 0
+    return result + current
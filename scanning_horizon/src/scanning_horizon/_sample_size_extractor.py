@@ -0,0 +1,178 @@
+import hashlib
+import json
+import re
+
+from scanning_horizon._number_words import words_to_int
+
+# Increment when a change to the extraction logic changes its results, so
+# that cached results (see `ExtractionCache`) are recomputed.
+EXTRACTOR_VERSION = "1"
+
+POPULATIONS = (
+    "volunteers",
+    "subjects",
+    "individuals",
+    "participants",
+    "students",
+    "patients",
+    "outpatients",
+    "undergraduates",
+    "adults",
+    "control",
+    "people",
+    "stroke",
+    "children",
+)
+
+PATTERN_FAMILIES = ("population", "n_equals")
+
+
+class SampleSizeExtractor:
+    """Find sample sizes such as "12 healthy subjects" or "(n = 12)".
+
+    This reproduces `_get_ns_sample_sizes.estimate_n` but the regular
+    expressions are built and compiled once, when the extractor is created.
+    The text is still lowercased: `str.lower` is much cheaper than matching
+    with `re.IGNORECASE`, which roughly doubles the matching time.
+
+    Unless `prefilter` is False, the (slow, backtracking) population pattern
+    only runs on windows around occurrences of the population words, and the
+    "n = " pattern only on texts containing "=". This gives the same results
+    as scanning the whole text. The number of characters that were not
+    scanned is counted in `n_skipped_chars`, out of `n_chars` (counters are
+    per process: they are not updated by `n_jobs` worker processes).
+
+    Parameters
+    ----------
+    populations : sequence of str, optional
+        Words designating a group of participants. Defaults to `POPULATIONS`.
+    patterns : sequence of str, optional
+        Pattern families to enable, among "population" (a number followed by
+        a population word) and "n_equals" ("n = 12"). Defaults to both.
+    prefilter : bool
+        Skip the parts of the text that cannot contain a match.
+    """
+
+    def __init__(self, populations=None, patterns=None, prefilter=True):
+        if populations is None:
+            populations = POPULATIONS
+        if patterns is None:
+            patterns = PATTERN_FAMILIES
+        unknown = set(patterns).difference(PATTERN_FAMILIES)
+        if unknown:
+            raise ValueError(
+                f"Unknown pattern families: {sorted(unknown)}. "
+                f"Choose among {PATTERN_FAMILIES}."
+            )
+        self.populations = tuple(populations)
+        self.patterns = tuple(patterns)
+        self.prefilter = prefilter
+        self.n_chars = 0
+        self.n_skipped_chars = 0
+        self._population_pattern = None
+        self._population_keyword_pattern = None
+        self._n_equals_pattern = None
+        if "population" in self.patterns and self.populations:
+            populations_alternation = "|".join(
+                re.escape(p.lower()) for p in self.populations
+            )
+            self._population_pattern = re.compile(
+                r"([a-zA-Z0-9\-]+)\s+([^\s]+\s+)?(%s)"
+                % populations_alternation
+            )
+            # a population word can only match right after whitespace
+            self._population_keyword_pattern = re.compile(
+                r"(?<=\s)(?:%s)" % populations_alternation
+            )
+        if "n_equals" in self.patterns:
+            self._n_equals_pattern = re.compile(r"[\(\s]+n\s*=\s*(\d+)")
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(populations={self.populations!r}, "
+            f"patterns={self.patterns!r}, prefilter={self.prefilter!r})"
+        )
+
+    @property
+    def cache_id(self):
+        """(name, version) identifying this extractor's results in a cache."""
+        config = json.dumps([self.populations, self.patterns])
+        config_hash = hashlib.sha256(config.encode("utf-8")).hexdigest()
+        return (
+            f"scanning_horizon.{self.__class__.__name__}",
+            f"{EXTRACTOR_VERSION}-{config_hash[:12]}",
+        )
+
+    def extract(self, text):
+        """Return a list of (snippet, n, start, end) tuples."""
+        text = text.lower()
+        self.n_chars += len(text)
+        result = []
+        if self._population_pattern is not None:
+            if self.prefilter:
+                windows = self._population_windows(text)
+                self.n_skipped_chars += len(text) - sum(
+                    end - start for start, end in windows
+                )
+            else:
+                windows = [(0, len(text))]
+            for start, end in windows:
+                for match in self._population_pattern.finditer(
+                    text, start, end
+                ):
+                    n = _parse_number(match.group(1))
+                    if n is not None:
+                        result.append(
+                            (
+                                " ".join(match.group(0).split()),
+                                n,
+                                match.start(),
+                                match.end(),
+                            )
+                        )
+        if self._n_equals_pattern is not None and (
+            "=" in text or not self.prefilter
+        ):
+            for match in self._n_equals_pattern.finditer(text):
+                n = int(match.group(1))
+                result.append((f"n = {n}", n, match.start(), match.end()))
+        return result
+
+    def _population_windows(self, text):
+        # A match is "<G1> <G2> <population word>" where G1 and G2 contain no
+        # whitespace and G2 is optional, so it starts at most 2 tokens before
+        # the population word. Overlapping windows are merged so that running
+        # the pattern on each window finds exactly the matches it finds when
+        # scanning the whole text.
+        windows = []
+        for keyword in self._population_keyword_pattern.finditer(text):
+            start = _token_start(text, keyword.start(), 2)
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = keyword.end()
+            else:
+                windows.append([start, keyword.end()])
+        return windows
+
+    def n_participants(self, text):
+        """Total number of participants found in `text`, or None."""
+        groups = self.extract(text)
+        if not groups:
+            return None
+        return sum(g[1] for g in groups)
+
+
+def _token_start(text, pos, n_tokens):
+    """Start of the `n_tokens`-th whitespace-separated token before `pos`."""
+    for _ in range(n_tokens):
+        while pos and text[pos - 1].isspace():
+            pos -= 1
+        while pos and not text[pos - 1].isspace():
+            pos -= 1
+    return pos
+
+
+def _parse_number(word):
+    # `word` only contains ASCII letters, digits and hyphens
+    if word.isdigit():
+        return int(word)
+    return words_to_int(word)
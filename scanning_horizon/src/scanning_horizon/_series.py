@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from scanning_horizon._information_extraction import _DEFAULT_EXTRACTOR
+from scanning_horizon._sample_size_extractor import _parse_number
+
+MATCH_COLUMNS = ["pmcid", "snippet", "n", "start", "end"]
+
+
+def n_participants_from_series(texts, extractor=None):
+    """Total number of participants for each text in a pandas Series.
+
+    Equivalent to `n_participants_from_texts(texts)`, returned as a float
+    Series with the same index as `texts` and NaN where nothing was found.
+    """
+    matches = _find_matches(texts, extractor)
+    totals = (
+        matches["n"]
+        .groupby(matches["_position"], sort=False)
+        .sum()
+        .reindex(np.arange(len(texts)))
+    )
+    return pd.Series(
+        totals.values.astype(float), index=texts.index, name="n_participants"
+    )
+
+
+def sample_size_matches_from_series(texts, extractor=None):
+    """All sample-size mentions in a Series of texts, as a long DataFrame.
+
+    The texts are matched with `Series.str.extractall`, so there is no
+    Python-level loop over rows; words such as "twelve" are converted with
+    a lookup table built from the distinct matched words. The index of
+    `texts` gives the "pmcid" column. Rows are ordered as in
+    `SampleSizeExtractor.extract` (population mentions, then "n = " mentions,
+    for each text), and "start" and "end" are offsets in the text.
+
+    Note that `extractall` scans whole texts: the keyword prefilter of
+    `SampleSizeExtractor` does not apply, so for plain throughput
+    `n_participants_from_texts` is faster.
+    """
+    return _find_matches(texts, extractor).loc[:, MATCH_COLUMNS]
+
+
+def _find_matches(texts, extractor):
+    if extractor is None:
+        extractor = _DEFAULT_EXTRACTOR
+    # object dtype so that lowercasing and matching use Python's `str` and
+    # `re`, as `SampleSizeExtractor` does (pyarrow-backed strings would use
+    # Arrow's lowercasing and RE2, which for example has an ASCII-only `\s`)
+    lower_texts = pd.Series(texts.values, dtype=object).str.lower()
+    all_matches = []
+    for family_idx, pattern in enumerate(
+        (extractor._population_pattern, extractor._n_equals_pattern)
+    ):
+        if pattern is None:
+            continue
+        family_matches = _extract_with_positions(lower_texts, pattern)
+        family_matches["n"] = _lookup_numbers(family_matches["group_1"])
+        if family_idx == 0:
+            family_matches = family_matches.dropna(subset="n")
+            family_matches["snippet"] = family_matches["match"].str.replace(
+                r"\s+", " ", regex=True
+            )
+        else:
+            family_matches["snippet"] = "n = " + family_matches["n"].astype(
+                "int64"
+            ).astype(str)
+        family_matches["_family"] = family_idx
+        all_matches.append(family_matches)
+    if not all_matches:
+        return pd.DataFrame(columns=MATCH_COLUMNS + ["_position"])
+    matches = pd.concat(all_matches).sort_values(
+        ["_position", "_family", "start"], kind="stable"
+    )
+    matches["n"] = matches["n"].astype("int64")
+    matches["pmcid"] = texts.index.values[matches["_position"].values]
+    return matches.loc[:, MATCH_COLUMNS + ["_position"]].reset_index(
+        drop=True
+    )
+
+
+def _extract_with_positions(texts, pattern):
+    # `extractall` does not give match positions. We capture the text
+    # skipped since the end of the previous match with a lazy prefix, and
+    # recover the offsets with a cumulative sum. The `\Z` alternative makes
+    # the last match of each text swallow the remainder, which keeps the
+    # scan linear when there are no more matches.
+    n_groups = pattern.groups
+    full_pattern = r"(?s:(.*?))(?:(%s)|\Z)" % pattern.pattern
+    extracted = texts.str.extractall(full_pattern, flags=pattern.flags)
+    extracted.columns = ["prefix", "match"] + [
+        f"group_{i + 1}" for i in range(n_groups)
+    ]
+    match_len = extracted["match"].str.len().fillna(0).astype("int64")
+    consumed = extracted["prefix"].str.len().fillna(0).astype(
+        "int64"
+    ) + match_len
+    extracted["end"] = consumed.groupby(level=0, sort=False).cumsum()
+    extracted["start"] = extracted["end"] - match_len
+    extracted["_position"] = extracted.index.get_level_values(0).astype(
+        "int64"
+    )
+    return extracted.dropna(subset="match").reset_index(drop=True)
+
+
+def _lookup_numbers(words):
+    table = {word: _parse_number(word) for word in words.unique()}
+    return words.map(table).astype(float)
@@ -0,0 +1,15 @@
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "import_time: compares import times to budgets, which depends on the "
+        "machine; only runs when selected with -m import_time",
+    )
+
+
+def pytest_runtest_setup(item):
+    selected = "import_time" in (item.config.option.markexpr or "")
+    if item.get_closest_marker("import_time") and not selected:
+        pytest.skip("import times are only checked with -m import_time")
@@ -0,0 +1,31 @@
+"""Import costs; see benchmarks/check_import_time.py."""
+import pathlib
+import sys
+
+import pytest
+
+_PACKAGE_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_PACKAGE_DIR / "benchmarks"))
+
+import check_import_time  # noqa: E402
+
+_PYTHON_PATH = [str(_PACKAGE_DIR / "src")]
+
+
+@pytest.mark.parametrize("statement", check_import_time.DEFAULT_BUDGETS)
+def test_no_heavy_imports(statement):
+    assert not check_import_time.imported_modules(
+        statement, python_path=_PYTHON_PATH
+    )
+
+
+@pytest.mark.import_time
+def test_import_time():
+    rows, over_budget = check_import_time.check(
+        check_import_time.DEFAULT_BUDGETS, repeat=5, python_path=_PYTHON_PATH
+    )
+    assert not over_budget, [
+        f"{statement}: {time_ms:.1f} ms > {budget_ms:.0f} ms"
+        for statement, time_ms, budget_ms in rows
+        if statement in over_budget
+    ]
@@ -0,0 +1,93 @@
+"""`SampleSizeExtractor` gives the same results as the original script."""
+import pathlib
+import sys
+
+import pytest
+
+from scanning_horizon import SampleSizeExtractor
+from scanning_horizon._get_ns_sample_sizes import estimate_n, text2int
+from scanning_horizon._number_words import words_to_int
+
+sys.path.insert(
+    0, str(pathlib.Path(__file__).resolve().parents[1] / "benchmarks")
+)
+
+import synthetic_corpus  # noqa: E402
+
+TEXTS = [
+    "",
+    "We scanned 12 healthy subjects and 10 patients.",
+    "Twenty-five right-handed VOLUNTEERS took part (n = 25).",
+    "Participants (n=14) and controls (N = 16) were scanned.",
+    "thirty-first\tstroke  patients\nand fifty-two children",
+    "one hundred and twenty participants",
+    "The 3T scanner; four older adults; many subjects; n = 7",
+    "Control subjects: seventy two control people, nineteenth individuals",
+    "a twelve students",
+    "text without any sample size, nor an equal sign",
+    "(n = 3)(n = 4) n=5 n = ",
+]
+TEXTS += synthetic_corpus.generate_texts(30, "abstract", seed=0)
+TEXTS += synthetic_corpus.generate_texts(5, "full_text", seed=1)
+
+WORDS = [
+    "",
+    "one",
+    "twelve",
+    "twenty",
+    "twenty-five",
+    "ninety-nine",
+    "first",
+    "fourth",
+    "twentieth",
+    "thirty-first",
+    "one-hundred",
+    "two thousand three hundred",
+    "th",
+    "million",
+    "and",
+    "healthy",
+    "3t",
+    "twelve-year",
+]
+
+
+def _legacy_words_to_int(word):
+    try:
+        return text2int(word)
+    except Exception:
+        return None
+
+
+@pytest.mark.parametrize("prefilter", [True, False])
+@pytest.mark.parametrize("text", TEXTS)
+def test_extract_matches_estimate_n(text, prefilter):
+    extractor = SampleSizeExtractor(prefilter=prefilter)
+    assert extractor.extract(text) == estimate_n(text)
+
+
+@pytest.mark.parametrize("word", WORDS)
+def test_words_to_int_matches_text2int(word):
+    assert words_to_int(word) == _legacy_words_to_int(word)
+
+
+CUSTOM_POPULATIONS = [
+    None,
+    ("healthy controls", "controls", "older adults"),
+    ("adults", "older adults", "rats"),
+]
+CUSTOM_TEXTS = [
+    "We scanned 12 healthy controls and 8 healthy controls.",
+    "12 young healthy controls, 3 healthy  controls\n4 older adults",
+    "n = 3 older adults older adults 5 older adults and six rats",
+    "healthy controls 7 healthy controls healthy controls",
+    "twenty older\tadults, 30 controls (n=30); ten pirates",
+]
+
+
+@pytest.mark.parametrize("populations", CUSTOM_POPULATIONS)
+@pytest.mark.parametrize("text", TEXTS + CUSTOM_TEXTS)
+def test_prefilter_does_not_change_results(text, populations):
+    with_prefilter = SampleSizeExtractor(populations, prefilter=True)
+    without_prefilter = SampleSizeExtractor(populations, prefilter=False)
+    assert with_prefilter.extract(text) == without_prefilter.extract(text)
@@ -0,0 +1,267 @@
+"""Run API calls concurrently, adapting the concurrency to the API's health.
+
+`AdaptiveDispatcher` runs a (synchronous) function on many items with
+asyncio, allowing up to `AIMDLimit.limit` calls in flight. The limit follows
+an additive-increase / multiplicative-decrease rule, as in TCP congestion
+control: it grows by about one for each "round" of successful calls whose
+latency stays close to the best latency seen, and is multiplied by
+`decrease_factor` when the API signals overload (HTTP 429 or 5xx). Such calls
+are retried after an exponential backoff with full jitter (or the delay
+requested by the API, if longer).
+
+`DispatchMetrics` holds live counts (in flight, completed, retries, ...) and
+rates over the last seconds; they are printed every `report_every` seconds.
+"""
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+# HTTP statuses after which a call is retried, and the concurrency reduced
+_THROTTLING_STATUSES = {408, 409, 429}
+
+
+def retry_delay_hint(error):
+    """Delay requested by the API (Retry-After header) in seconds, or None."""
+    headers = getattr(error, "headers", None)
+    response = getattr(error, "response", None)
+    if headers is None and response is not None:
+        headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttling_error(error):
+    """Whether `error` is a 429 or 5xx response (openai or urllib errors)."""
+    status = getattr(error, "status_code", getattr(error, "code", None))
+    if not isinstance(status, int):
+        return False
+    return status in _THROTTLING_STATUSES or status >= 500
+
+
+class AIMDLimit:
+    """Concurrency limit with additive increase, multiplicative decrease.
+
+    Parameters
+    ----------
+    initial, minimum, maximum : int
+        Starting value and bounds of the limit.
+    decrease_factor : float
+        The limit is multiplied by this on throttling.
+    latency_tolerance : float
+        The limit only grows while call latency is below this many times the
+        lowest latency seen.
+    """
+
+    def __init__(
+        self,
+        initial=2,
+        minimum=1,
+        maximum=32,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.min_latency = None
+        self.last_decrease = float("-inf")
+
+    def on_success(self, latency):
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if latency <= self.latency_tolerance * self.min_latency:
+            # about +1 once every `limit` calls, i.e. once per round
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttled(self, start_time):
+        """Decrease the limit, once for all calls started before the last
+        decrease: they reflect the load before it."""
+        if start_time < self.last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        self.last_decrease = time.monotonic()
+
+
+class DispatchMetrics:
+    """Counts of dispatched calls, and rates over the last `window` seconds."""
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.tokens = 0
+        self.start_time = time.monotonic()
+        self._recent = collections.deque()
+
+    def record_completion(self, n_tokens):
+        now = time.monotonic()
+        self.completed += 1
+        self.tokens += n_tokens
+        self._recent.append((now, n_tokens))
+        while self._recent and self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        recent = [(t, n) for t, n in self._recent if t >= now - self.window]
+        window = min(self.window, now - self.start_time) or 1.0
+        return {
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "requests_per_s": round(len(recent) / window, 2),
+            "tokens_per_s": round(sum(n for _, n in recent) / window, 1),
+        }
+
+
+class AdaptiveDispatcher:
+    """Apply `call` to items with an adaptive number of concurrent calls.
+
+    Parameters
+    ----------
+    call : callable
+        Synchronous function of one item; runs in a thread.
+    before_call : callable or None
+        Synchronous function of one item, run in the same thread before
+        each attempt of `call`, e.g. to wait for a rate limiter. Its
+        duration is not counted in the latency seen by `limit`, so that
+        waiting for our own rate limits does not reduce the concurrency.
+    limit : AIMDLimit or None
+        Concurrency controller (default: `AIMDLimit()`).
+    max_retries : int
+        Retries of a call after throttling errors; other errors are not
+        retried.
+    base_delay, max_delay : float
+        Bounds of the exponential backoff, in seconds.
+    n_tokens : callable
+        Estimated tokens used by the call for an item, for the metrics.
+    report_every : float or None
+        Print the metrics every this many seconds.
+    """
+
+    def __init__(
+        self,
+        call,
+        limit=None,
+        before_call=None,
+        max_retries=8,
+        base_delay=0.5,
+        max_delay=60.0,
+        n_tokens=lambda item: 0,
+        report_every=None,
+    ):
+        self.call = call
+        self.before_call = before_call
+        self.limit = AIMDLimit() if limit is None else limit
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.n_tokens = n_tokens
+        self.report_every = report_every
+        self.metrics = DispatchMetrics()
+        self._random = random.Random(0)
+
+    def run(self, items, on_result, on_error=None):
+        """Call `on_result(item, result)` (or `on_error(item, exception)`)
+        for each item, as calls complete. Returns the final metrics."""
+        return asyncio.run(self._run(items, on_result, on_error))
+
+    async def _run(self, items, on_result, on_error):
+        self.metrics = DispatchMetrics()
+        self._slots = asyncio.Condition()
+        executor = ThreadPoolExecutor(self.limit.maximum)
+        reporter = None
+        if self.report_every is not None:
+            reporter = asyncio.create_task(self._report())
+        tasks = set()
+        try:
+            for item in items:
+                await self._acquire_slot()
+                task = asyncio.create_task(
+                    self._process(item, executor, on_result, on_error)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            executor.shutdown(wait=True)
+        return self.metrics.snapshot()
+
+    async def _acquire_slot(self):
+        async with self._slots:
+            await self._slots.wait_for(
+                lambda: self.metrics.in_flight < int(self.limit.limit)
+            )
+            self.metrics.in_flight += 1
+
+    async def _release_slot(self):
+        async with self._slots:
+            self.metrics.in_flight -= 1
+            self._slots.notify_all()
+
+    async def _process(self, item, executor, on_result, on_error):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            if self.before_call is not None:
+                await loop.run_in_executor(executor, self.before_call, item)
+            start = time.monotonic()
+            try:
+                result = await loop.run_in_executor(executor, self.call, item)
+            except Exception as error:
+                throttled = is_throttling_error(error)
+                if throttled:
+                    self.metrics.throttled += 1
+                    self.limit.on_throttled(start)
+                await self._release_slot()
+                if not throttled or attempt >= self.max_retries:
+                    self.metrics.failed += 1
+                    if on_error is None:
+                        raise
+                    on_error(item, error)
+                    return
+                await asyncio.sleep(self._backoff(attempt, error))
+                attempt += 1
+                self.metrics.retries += 1
+                await self._acquire_slot()
+                continue
+            self.limit.on_success(time.monotonic() - start)
+            self.metrics.record_completion(self.n_tokens(item))
+            await self._release_slot()
+            on_result(item, result)
+            return
+
+    def _backoff(self, attempt, error):
+        delay = self._random.uniform(
+            0, min(self.max_delay, self.base_delay * 2**attempt)
+        )
+        hint = retry_delay_hint(error)
+        if hint is not None:
+            delay = max(delay, hint)
+        return delay
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            print(
+                {
+                    "limit": round(self.limit.limit, 1),
+                    **self.metrics.snapshot(),
+                }
+            )
@@ -3,9 +3,43 @@ import json
 from pubextract.participants import annotate_labelbuddy_docs
 import utils
 
+EXTRACTOR_NAME = "pubextract.participants.annotate_labelbuddy_docs"
+# bump when the format of the cached annotated documents changes
+CACHE_FORMAT_VERSION = 2
+
+
+def _annotate(docs):
+    # the text is not stored in the cache when it is the same as the
+    # input's: it is replaced by None, which keeps the order of the keys
+    return [
+        {
+            key: None if key == "text" and value == doc["text"] else value
+            for key, value in annotated_doc.items()
+        }
+        for doc, (annotated_doc, _) in zip(
+            docs, annotate_labelbuddy_docs(docs)
+        )
+    ]
+
+
 output_file = utils.get_outputs_dir() / "automatically_annotated_docs.json"
 docs = utils.load_labelbuddy_docs()
-annotated_docs = [doc for doc, _ in annotate_labelbuddy_docs(docs)]
+with utils.get_extraction_cache() as cache:
+    annotations = utils.cached_extraction(
+        cache,
+        EXTRACTOR_NAME,
+        f"{utils.get_package_version('pubextract')}"
+        f"+cache-{CACHE_FORMAT_VERSION}",
+        docs,
+        _annotate,
+    )
+annotated_docs = [
+    {
+        key: doc["text"] if key == "text" and value is None else value
+        for key, value in annotated_doc.items()
+    }
+    for doc, annotated_doc in zip(docs, annotations)
+]
 
 output_file.write_text(json.dumps(annotated_docs), "utf-8")
 
@@ -0,0 +1,7 @@
+"""Write demographics joined with pubget metadata to a Parquet store.
+
+The store is partitioned by publication year; see `demographics_table`.
+"""
+import utils
+
+utils.build_demographics_store()
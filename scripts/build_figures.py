@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+"""Render the demographics figures in one process, loading the data once.
+
+The demographics and metadata tables are loaded in the main process, then
+each figure is rendered by a worker forked from it: workers see the loaded
+tables (and the imported plotting libraries) without copying or reloading
+them. The time taken by each figure is printed at the end.
+
+Example:
+    python scripts/build_figures.py -j 4
+    python scripts/build_figures.py plot_ages
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+from matplotlib import pyplot as plt
+
+import n_participants_distribution
+import plot_ages
+import plot_n_participants
+import summary_n_participants
+import utils
+
+# tables loaded by the main process before forking the workers; never
+# modified by the figures
+_SHARED_DATA = {}
+
+
+def load_shared_data():
+    articles, groups = plot_ages.load_demographics()
+    return {
+        "n_participants": utils.load_n_participants(0),
+        "neurosynth": utils.load_neurosynth_sample_sizes(),
+        "david": utils.load_david_sample_sizes(),
+        "articles": articles,
+        "groups": groups,
+    }
+
+
+def _single_group_studies(data, min_papers):
+    data = utils.select_years(data["n_participants"], min_papers)
+    return data[data["n_groups"] == 1]
+
+
+def _n_participants(data):
+    demographics_data = _single_group_studies(
+        data, plot_n_participants.MIN_PAPERS
+    )
+    fig = plot_n_participants.make_figure(
+        demographics_data, data["neurosynth"], data["david"]
+    )
+    return {"n_participants.pdf": fig}
+
+
+def _n_participants_distribution(data):
+    demographics_data = _single_group_studies(
+        data, n_participants_distribution.MIN_PAPERS
+    )
+    demographics_data = demographics_data[
+        demographics_data["publication_year"].dt.year > 2017
+    ]
+    fig = n_participants_distribution.make_figure(
+        n_participants_distribution.prepare_data(demographics_data)
+    )
+    return {"n_participants_distribution.pdf": fig}
+
+
+def _ages(data):
+    return plot_ages.make_figures(data["articles"], data["groups"])
+
+
+def _summary(data):
+    summary_n_participants.make_summary(data["n_participants"]).to_csv(
+        utils.get_outputs_dir() / "n_participants_full_dataset.csv"
+    )
+    return {}
+
+
+# name -> function returning {file name: figure} from the shared data
+FIGURES = {
+    "plot_n_participants": _n_participants,
+    "n_participants_distribution": _n_participants_distribution,
+    "plot_ages": _ages,
+    "summary_n_participants": _summary,
+}
+
+
+def render(name):
+    """Render and save a figure; return (name, seconds, written files)."""
+    start = time.perf_counter()
+    figures = FIGURES[name](_SHARED_DATA)
+    figures_dir = utils.get_figures_dir()
+    for file_name, fig in figures.items():
+        fig.savefig(figures_dir / file_name, bbox_inches="tight")
+        plt.close(fig)
+    return name, time.perf_counter() - start, list(figures)
+
+
+def build_figures(names, n_jobs=1):
+    """Render the figures, each in a forked worker if `n_jobs` > 1.
+
+    Returns a list of (name, seconds, written files).
+    """
+    start = time.perf_counter()
+    _SHARED_DATA.update(load_shared_data())
+    print(f"Loaded shared data in {time.perf_counter() - start:.2f} s")
+    if n_jobs == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return [render(name) for name in names]
+    with ProcessPoolExecutor(
+        min(n_jobs, len(names)), mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        return list(executor.map(render, names))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "figures",
+        nargs="*",
+        help=f"Figures to build, among {', '.join(FIGURES)}. "
+        "Default is all of them.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of rendering workers. Default is one per CPU.",
+        type=int,
+        default=None,
+    )
+    args = parser.parse_args()
+
+    names = args.figures or list(FIGURES)
+    unknown = set(names) - FIGURES.keys()
+    if unknown:
+        parser.error(f"Unknown figures: {', '.join(sorted(unknown))}")
+    n_jobs = args.jobs or multiprocessing.cpu_count()
+    start = time.perf_counter()
+    results = build_figures(names, n_jobs)
+    width = max(len(name) for name in names)
+    for name, seconds, file_names in results:
+        print(f"{name:<{width}}  {seconds:>6.2f} s  {', '.join(file_names)}")
+    print(f"{'total':<{width}}  {time.perf_counter() - start:>6.2f} s")
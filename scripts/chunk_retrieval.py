@@ -0,0 +1,195 @@
+#! /usr/bin/env python3
+"""Select the chunks of each article most similar to query embeddings.
+
+Works on an embedding store (see embedding_store.py), in which the chunks of
+each article are consecutive. Chunks are scored in blocks of whole articles:
+each block of the (memory-mapped) embedding matrix is multiplied with all
+the query embeddings at once, a chunk's score being its best similarity to
+any query. The top k chunks of each article in the block are then found
+with a single `argpartition` on a (n_articles, max_chunks_per_article)
+matrix of scores, padded with -inf. Blocks are sized so that the embeddings,
+scores and padded matrix fit in `memory_budget_bytes`.
+
+OpenAI embeddings have unit norm, so the dot product is the cosine
+similarity.
+
+Example:
+    python scripts/chunk_retrieval.py \\
+        data/outputs/all_documents_embeddings_tokens-4000.embeddings \\
+        --query "How many participants or subjects were recruited?" \\
+        --output data/outputs/gpt/selected_chunks.parquet
+"""
+import argparse
+
+import numpy as np
+
+import embedding_store
+
+DEFAULT_MEMORY_BUDGET_BYTES = 512 * 1024**2
+
+
+def document_offsets(pmcids):
+    """Start of each document (run of equal pmcids), plus the total length."""
+    pmcids = np.asarray(pmcids)
+    if not len(pmcids):
+        return np.zeros(1, dtype="int64")
+    starts = np.flatnonzero(pmcids[1:] != pmcids[:-1]) + 1
+    return np.concatenate([[0], starts, [len(pmcids)]]).astype("int64")
+
+
+def _document_blocks(offsets, row_bytes, memory_budget_bytes):
+    """Split documents into blocks of at most `memory_budget_bytes`."""
+    lengths = np.diff(offsets)
+    n_documents = len(lengths)
+    # documents have at least one chunk: no block has more documents
+    max_block_size = memory_budget_bytes // row_bytes + 1
+    start = 0
+    while start < n_documents:
+        end = min(n_documents, start + max_block_size)
+        # each document costs its rows, plus a padded row of the score
+        # matrix as long as the longest document of the block
+        max_lengths = np.maximum.accumulate(lengths[start:end])
+        n_rows = offsets[start + 1 : end + 1] - offsets[start]
+        n_docs = np.arange(1, end - start + 1)
+        cost = n_rows * row_bytes + n_docs * max_lengths * 16
+        # always make progress, even if one document exceeds the budget
+        n_fitting = np.searchsorted(cost, memory_budget_bytes, "right")
+        stop = start + max(1, int(n_fitting))
+        yield start, stop
+        start = stop
+
+
+def top_k_chunks(
+    embeddings,
+    offsets,
+    queries,
+    k=1,
+    memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES,
+):
+    """Best `k` chunks of each document, by similarity to the queries.
+
+    Parameters
+    ----------
+    embeddings : array of shape (n_chunks, dim)
+        Chunk embeddings (e.g. memory-mapped), documents stored contiguously.
+    offsets : array of shape (n_documents + 1,)
+        Start of each document's chunks, and n_chunks (see
+        `document_offsets`).
+    queries : array of shape (n_queries, dim) or (dim,)
+        Query embeddings.
+    k : int
+        Number of chunks per document.
+    memory_budget_bytes : int
+        Approximate memory used for each block of documents.
+
+    Returns
+    -------
+    rows : int array of shape (n_documents, k)
+        Rows of the selected chunks in `embeddings`, best first; -1 for
+        documents with fewer than `k` chunks.
+    scores : float32 array of shape (n_documents, k)
+        Their scores; -inf where `rows` is -1.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype="float32"))
+    offsets = np.asarray(offsets, dtype="int64")
+    n_documents = len(offsets) - 1
+    rows = np.full((n_documents, k), -1, dtype="int64")
+    scores = np.full((n_documents, k), -np.inf, dtype="float32")
+    row_bytes = 4 * (embeddings.shape[1] + len(queries))
+    for start, stop in _document_blocks(
+        offsets, row_bytes, memory_budget_bytes
+    ):
+        first_row = offsets[start]
+        block = np.asarray(embeddings[first_row : offsets[stop]])
+        block_scores = (block @ queries.T).max(axis=1)
+        lengths = np.diff(offsets[start : stop + 1])
+        width = max(int(lengths.max()), k)
+        positions = np.arange(width)
+        valid = positions < lengths[:, None]
+        local_rows = np.where(
+            valid, (offsets[start:stop] - first_row)[:, None] + positions, 0
+        )
+        padded = np.where(valid, block_scores[local_rows], -np.inf)
+        top = np.argpartition(-padded, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(padded, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        found = np.isfinite(top_scores)
+        rows[start:stop] = np.where(
+            found, top + offsets[start:stop, None], -1
+        )
+        scores[start:stop] = top_scores
+    return rows, scores
+
+
+def select_chunks(
+    store_dir, queries, k=1, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES
+):
+    """Metadata of the best `k` chunks of each article of a store.
+
+    Returns a DataFrame with the chunks' metadata, their rank within their
+    article (0 is the best) and score.
+    """
+    chunks, embeddings = embedding_store.load_embedding_store(store_dir)
+    rows, scores = top_k_chunks(
+        embeddings,
+        document_offsets(chunks["pmcid"].to_numpy()),
+        queries,
+        k,
+        memory_budget_bytes,
+    )
+    found = rows >= 0
+    selected = chunks.iloc[rows[found]].reset_index(drop=True)
+    selected["rank"] = np.nonzero(found)[1]
+    selected["score"] = scores[found]
+    return selected
+
+
+def embed_queries(queries, model="text-embedding-ada-002"):
+    from openai import OpenAI
+
+    response = OpenAI().embeddings.create(input=queries, model=model)
+    return np.asarray(
+        [item.embedding for item in response.data], dtype="float32"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("store_dir", help="Embedding store.", type=str)
+    parser.add_argument(
+        "--query",
+        help="Query text, embedded with the OpenAI API. Can be repeated.",
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "--query_embeddings",
+        help=".npy file of query embeddings, instead of --query.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument("-k", type=int, default=1)
+    parser.add_argument(
+        "--memory_budget_mb",
+        type=float,
+        default=DEFAULT_MEMORY_BUDGET_BYTES / 1024**2,
+    )
+    parser.add_argument("-o", "--output", type=str, required=True)
+    args = parser.parse_args()
+
+    if (args.query is None) == (args.query_embeddings is None):
+        parser.error("Give either --query or --query_embeddings.")
+    if args.query is not None:
+        queries = embed_queries(args.query)
+    else:
+        queries = np.load(args.query_embeddings)
+    selected = select_chunks(
+        args.store_dir,
+        queries,
+        args.k,
+        int(args.memory_budget_mb * 1024**2),
+    )
+    selected.to_parquet(args.output, index=False)
+    print(f"{len(selected)} chunks written to {args.output}")
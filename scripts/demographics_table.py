@@ -0,0 +1,285 @@
+"""Load selected fields of demographics.jsonl into typed columns.
+
+Each line of demographics.jsonl is a full article record. Only the requested
+fields of its "demographics" entry (and of each of its groups) are kept, in
+compact typed arrays rather than lists of dicts, and lines are decoded with
+orjson when it is installed.
+
+The demographics can also be joined with the pubget metadata and written to
+a Parquet store partitioned by publication year, from which loaders read
+only the columns and rows they need. pyarrow is imported only by the
+functions that use this store.
+"""
+import array
+import json
+import math
+import os
+import pathlib
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+ARTICLE_FIELDS = ("count", "females_count", "males_count", "age_mean")
+GROUP_FIELDS = ("participant_type", "count", "age_mean")
+STORE_GROUP_FIELDS = (
+    "participant_type",
+    "count",
+    "females_count",
+    "males_count",
+    "age_mean",
+)
+
+# key of the Parquet schema metadata holding the original column order
+# (partition columns would otherwise come last)
+_COLUMNS_KEY = "demographics_store_columns"
+# column holding the position of each row in the table that was written,
+# because the dataset is read partition by partition
+_ROW_COLUMN = "_row"
+
+
+class _Column:
+    """Float64 array that switches to a list if it receives strings."""
+
+    def __init__(self):
+        self._values = array.array("d")
+
+    def append(self, value):
+        if value is None:
+            value = math.nan
+        try:
+            self._values.append(value)
+        except TypeError:
+            self._values = list(self._values)
+            self._values.append(value)
+
+    def to_array(self):
+        if isinstance(self._values, array.array):
+            return np.frombuffer(self._values, dtype="float64")
+        values = [None if v != v else v for v in self._values]
+        return pd.Categorical(values)
+
+
+def load_demographics(
+    demographics_file, article_fields=ARTICLE_FIELDS, group_fields=GROUP_FIELDS
+):
+    """Return (articles, groups) DataFrames.
+
+    `articles` has one row per line of the file, with the requested fields,
+    "n_groups" (the number of groups, possibly 0) and "pmcid" if the records
+    have one. `groups` has one row per participant group, with "article" (the
+    position of the article in `articles`) and the requested group fields.
+    Numeric fields are float64, with NaN for missing values; text fields
+    such as "participant_type" are categorical.
+
+    If a pmcid appears several times (articles extracted again after their
+    text changed, see `incremental_extraction.py`), its last record is kept.
+    """
+    article_columns = {field: _Column() for field in article_fields}
+    group_columns = {field: _Column() for field in group_fields}
+    n_groups, group_article, pmcids = array.array("q"), array.array("q"), []
+    with open(demographics_file, "rb") as demo_f:
+        for article_idx, article_json in enumerate(demo_f):
+            article_info = _loads(article_json)
+            pmcids.append(article_info.get("pmcid"))
+            demographics = article_info["demographics"]
+            for field, column in article_columns.items():
+                column.append(demographics.get(field))
+            groups = demographics["groups"]
+            n_groups.append(len(groups))
+            for group in groups:
+                group_article.append(article_idx)
+                for field, column in group_columns.items():
+                    column.append(group.get(field))
+    articles = pd.DataFrame(
+        {field: column.to_array() for field, column in article_columns.items()}
+    )
+    articles["n_groups"] = np.frombuffer(n_groups, dtype="int64")
+    if pmcids and None not in pmcids:
+        articles["pmcid"] = np.asarray(pmcids, dtype="int64")
+    groups = pd.DataFrame(
+        {"article": np.frombuffer(group_article, dtype="int64")}
+    )
+    for field, column in group_columns.items():
+        groups[field] = column.to_array()
+    if "pmcid" in articles.columns:
+        kept = ~articles["pmcid"].duplicated(keep="last").values
+        if not kept.all():
+            return _select_articles(articles, groups, kept)
+    return articles, groups
+
+
+def _select_articles(articles, groups, kept):
+    """Keep the articles where `kept` is true, and their groups."""
+    new_position = np.cumsum(kept) - 1
+    groups = groups[kept[groups["article"].values]].reset_index(drop=True)
+    groups["article"] = new_position[groups["article"].values]
+    return articles[kept].reset_index(drop=True), groups
+
+
+def group_counts_by_type(groups, n_articles):
+    """Wide table of "<participant type>_count" columns, one row per article.
+
+    As a dict would, keeps the last group of each type within an article.
+    Columns are in order of first appearance of the (lowercased) types.
+    """
+    types = groups["participant_type"].astype(str).str.lower()
+    last_groups = (
+        groups.loc[:, ["article", "count"]]
+        .assign(participant_type=types.values)
+        .drop_duplicates(["article", "participant_type"], keep="last")
+    )
+    counts = last_groups.pivot(
+        index="article", columns="participant_type", values="count"
+    )
+    counts = counts.reindex(
+        index=np.arange(n_articles), columns=pd.unique(types)
+    )
+    counts.columns = [f"{name}_count" for name in counts.columns]
+    return counts
+
+
+def write_demographics_store(demographics_file, metadata_file, store_dir):
+    """Write demographics joined with pubget metadata as Parquet datasets.
+
+    `store_dir` gets two datasets, both partitioned by publication year:
+    "articles", with one row per article (its metadata, total counts,
+    "n_groups" and the "<participant type>_count" columns), and "groups",
+    with one row per participant group. Articles are in the order of
+    `metadata_file`. The store is written next to `store_dir` and then moved
+    in place, replacing any previous version.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    store_dir = pathlib.Path(store_dir)
+    metadata = pd.read_csv(metadata_file)
+    articles, groups = _align_to_metadata(
+        *load_demographics(demographics_file, group_fields=STORE_GROUP_FIELDS),
+        metadata,
+    )
+    article_table = metadata.join(
+        articles.loc[:, ["count", "females_count", "males_count"]]
+    )
+    article_table["n_groups"] = np.maximum(1, articles["n_groups"])
+    article_table = article_table.join(
+        group_counts_by_type(groups, len(articles))
+    )
+    article_rows = metadata.loc[
+        groups["article"], ["pmcid", "publication_year"]
+    ]
+    group_table = pd.concat(
+        [
+            article_rows.reset_index(drop=True),
+            groups.drop(columns="article"),
+        ],
+        axis=1,
+    )
+    tmp_dir = store_dir.with_name(f"{store_dir.name}.tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    for name, table in [("articles", article_table), ("groups", group_table)]:
+        columns = list(table.columns)
+        table = pa.Table.from_pandas(
+            table.assign(**{_ROW_COLUMN: np.arange(len(table))}),
+            preserve_index=False,
+        )
+        table = table.replace_schema_metadata(
+            {_COLUMNS_KEY: json.dumps(columns)}
+        )
+        pq.write_to_dataset(
+            table, tmp_dir / name, partition_cols=["publication_year"]
+        )
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+
+
+def _align_to_metadata(articles, groups, metadata):
+    """Reorder articles to match the rows of `metadata`.
+
+    Records are matched by pmcid when they have one; otherwise the lines of
+    demographics.jsonl are assumed to be in the same order as metadata.csv.
+    Articles missing from demographics.jsonl get NaN counts and 0 groups.
+    """
+    if "pmcid" not in articles.columns:
+        return articles, groups
+    positions = pd.Index(articles["pmcid"]).get_indexer(metadata["pmcid"])
+    found = positions != -1
+    metadata_row = np.full(len(articles), -1)
+    metadata_row[positions[found]] = np.flatnonzero(found)
+    articles = articles.iloc[positions[found]].set_axis(
+        np.flatnonzero(found)
+    )
+    articles = articles.reindex(np.arange(len(metadata)))
+    articles["n_groups"] = articles["n_groups"].fillna(0).astype("int64")
+    groups = groups.assign(article=metadata_row[groups["article"].values])
+    groups = groups[groups["article"] != -1].reset_index(drop=True)
+    return articles, groups
+
+
+def read_demographics_store(
+    store_dir, table="articles", columns=None, filters=None
+):
+    """Read one of the datasets written by `write_demographics_store`.
+
+    Only `columns` are read, and `filters` are pushed down to the Parquet
+    reader: partitions of other years are skipped entirely and row groups
+    are filtered as they are read. `filters` is either a
+    `pyarrow.dataset.Expression` or a list of (column, op, value) tuples
+    that must all hold, e.g. ``[("n_groups", "==", 1), ("publication_year",
+    ">", 2017)]``.
+
+    Rows are in the order in which they were written (for "articles", that
+    of metadata.csv), and missing text values are NaN, as in the tables
+    read from CSV files.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(
+        pathlib.Path(store_dir) / table, format="parquet", partitioning="hive"
+    )
+    if filters is not None:
+        filters = filter_expression(filters)
+    if columns is None:
+        columns = json.loads(dataset.schema.metadata[_COLUMNS_KEY.encode()])
+    data = (
+        dataset.to_table(columns=[*columns, _ROW_COLUMN], filter=filters)
+        .to_pandas()
+        .sort_values(_ROW_COLUMN)
+        .drop(columns=_ROW_COLUMN)
+        .reset_index(drop=True)
+    )
+    for column in data.columns[data.dtypes == object]:
+        data[column] = data[column].where(data[column].notna(), np.nan)
+    return data
+
+
+def is_current_store(store_dir):
+    """Whether `store_dir` was written by this version of the module."""
+    import pyarrow.dataset as ds
+
+    try:
+        schema = ds.dataset(
+            pathlib.Path(store_dir) / "articles",
+            format="parquet",
+            partitioning="hive",
+        ).schema
+    except OSError:
+        return False
+    return _ROW_COLUMN in schema.names
+
+
+def filter_expression(filters):
+    """Filter expression from a list of (column, op, value) tuples."""
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    if isinstance(filters, ds.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
@@ -0,0 +1,254 @@
+#! /usr/bin/env python3
+"""Store of chunk embeddings as a float32 matrix and a metadata table.
+
+A store is a directory containing:
+
+- embeddings.npy: float32 array of shape (n_chunks, embedding_dim), loaded
+  with memory mapping so that opening a store reads nothing but the header;
+- chunks.parquet: one row per chunk, in the same order, with the pmcid,
+  the chunk's position in its document (chunk_index), its character offsets
+  (start_char, end_char) and any other metadata columns.
+
+Running this script migrates the embeddings written by publang (CSV files,
+or Parquet files made by csv_to_parquet.py, in which the embeddings are
+lists of strings) to stores.
+
+Example:
+    python scripts/embedding_store.py \\
+        data/outputs/all_documents_embeddings_tokens-4000.csv
+"""
+import argparse
+import io
+import os
+import pathlib
+import shutil
+
+import numpy as np
+import pandas as pd
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.parquet"
+_INTEGER_COLUMNS = ("pmcid", "chunk_index", "start_char", "end_char")
+
+
+def load_embedding_store(store_dir, mmap=True):
+    """Return (chunks, embeddings) of a store.
+
+    `chunks` is a DataFrame; `embeddings` is a read-only memory-mapped array
+    unless `mmap` is False.
+    """
+    store_dir = pathlib.Path(store_dir)
+    chunks = pd.read_parquet(store_dir / CHUNKS_FILE)
+    embeddings = np.load(
+        store_dir / EMBEDDINGS_FILE, mmap_mode="r" if mmap else None
+    )
+    return chunks, embeddings
+
+
+def _npy_header(n_rows, dim):
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        header,
+        {"descr": "<f4", "fortran_order": False, "shape": (n_rows, dim)},
+    )
+    return header.getvalue()
+
+
+class EmbeddingStoreWriter:
+    """Write a store one batch of chunks at a time.
+
+    The store is written in a temporary directory that replaces `store_dir`
+    when the writer is closed (or its `with` block exits without error).
+    Metadata columns must keep the same types across batches.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = pathlib.Path(store_dir)
+        self._tmp_dir = self.store_dir.with_name(f"{self.store_dir.name}.tmp")
+        if self._tmp_dir.exists():
+            shutil.rmtree(self._tmp_dir)
+        self._tmp_dir.mkdir(parents=True)
+        self._embeddings_f = open(self._tmp_dir / EMBEDDINGS_FILE, "wb")
+        self._chunks_writer = None
+        self.n_rows, self.dim = 0, None
+        # the shape is unknown until the end: reserve room for the header,
+        # which is rewritten once all rows are written
+        self._header_size = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self._embeddings_f.close()
+            if self._chunks_writer is not None:
+                self._chunks_writer.close()
+            shutil.rmtree(self._tmp_dir)
+
+    def append(self, chunks, embeddings):
+        """Add chunks (DataFrame) and their embeddings (2D array)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+        if embeddings.ndim != 2 or len(embeddings) != len(chunks):
+            raise ValueError(
+                f"Expected {len(chunks)} embeddings, got an array of "
+                f"shape {embeddings.shape}."
+            )
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            self._header_size = len(_npy_header(0, self.dim))
+            self._embeddings_f.write(b"\0" * self._header_size)
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(
+                f"Embeddings have dimension {embeddings.shape[1]}, "
+                f"expected {self.dim}."
+            )
+        self._embeddings_f.write(embeddings.tobytes())
+        table = pa.Table.from_pandas(
+            chunks.reset_index(drop=True),
+            schema=None
+            if self._chunks_writer is None
+            else self._chunks_writer.schema,
+            preserve_index=False,
+        )
+        if self._chunks_writer is None:
+            self._chunks_writer = pq.ParquetWriter(
+                self._tmp_dir / CHUNKS_FILE, table.schema
+            )
+        self._chunks_writer.write_table(table)
+        self.n_rows += len(chunks)
+
+    def close(self):
+        if self.dim is None:
+            raise ValueError("Cannot write an empty embedding store.")
+        header = _npy_header(self.n_rows, self.dim)
+        # numpy pads headers so that the first dimension can grow without
+        # changing their size
+        assert len(header) == self._header_size
+        self._embeddings_f.seek(0)
+        self._embeddings_f.write(header)
+        self._embeddings_f.close()
+        self._chunks_writer.close()
+        if self.store_dir.exists():
+            shutil.rmtree(self.store_dir)
+        os.replace(self._tmp_dir, self.store_dir)
+
+
+def parse_embeddings(values):
+    """2D float32 array from a column of embeddings stored as strings.
+
+    Cells are like "[0.1, 0.2]" (publang CSV files), or "['0.1', '0.2']".
+    """
+    values = list(values)
+    if not values:
+        return np.empty((0, 0), dtype="float32")
+    # a single call to the numpy parser for the whole column
+    text = ",".join(value.strip("[]") for value in values).replace("'", "")
+    embeddings = np.fromstring(text, dtype="float32", sep=",")
+    dim = values[0].count(",") + 1
+    if len(embeddings) != len(values) * dim:
+        raise ValueError("Embeddings do not all have the same dimension.")
+    return embeddings.reshape(len(values), dim)
+
+
+def _iter_batches(source, batch_size):
+    """Yield (metadata DataFrame, embeddings array) for batches of chunks."""
+    source = pathlib.Path(source)
+    if source.suffix == ".parquet":
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size):
+            column = batch.column("embedding")
+            if pa.types.is_string(column.type) or pa.types.is_large_string(
+                column.type
+            ):
+                embeddings = parse_embeddings(column.to_pylist())
+            else:
+                # lists of numbers, or of strings (csv_to_parquet.py)
+                lengths = pc.list_value_length(column).to_numpy()
+                if len(lengths) and (lengths != lengths[0]).any():
+                    raise ValueError(
+                        "Embeddings do not all have the same dimension."
+                    )
+                embeddings = (
+                    pc.cast(column.flatten(), pa.float32())
+                    .to_numpy()
+                    .reshape(len(column), -1 if len(column) else 0)
+                )
+            metadata = batch.drop_columns(["embedding"]).to_pandas()
+            yield metadata, embeddings
+    else:
+        for batch in pd.read_csv(
+            source,
+            chunksize=batch_size,
+            # column types are fixed in `_chunk_metadata`, the same way for
+            # all batches
+            dtype="object",
+        ):
+            yield batch.drop(columns="embedding"), parse_embeddings(
+                batch["embedding"]
+            )
+
+
+def _chunk_metadata(chunks, chunk_counts):
+    for column in chunks.columns:
+        if column in _INTEGER_COLUMNS:
+            chunks[column] = pd.to_numeric(chunks[column]).astype("Int64")
+        elif chunks[column].dtype == "object":
+            chunks[column] = chunks[column].astype("string")
+    if "chunk_index" not in chunks.columns:
+        # chunks of a document are consecutive, possibly across batches
+        offsets = chunks["pmcid"].map(chunk_counts).fillna(0).astype("Int64")
+        chunks.insert(
+            1, "chunk_index", chunks.groupby("pmcid").cumcount() + offsets
+        )
+        chunk_counts.update(
+            chunks.groupby("pmcid")["chunk_index"].max() + 1
+        )
+    return chunks
+
+
+def migrate_embeddings(source, store_dir, batch_size=10000):
+    """Convert publang embeddings (CSV or Parquet) to a store.
+
+    Returns the number of chunks.
+    """
+    chunk_counts = {}
+    with EmbeddingStoreWriter(store_dir) as writer:
+        for i, (metadata, embeddings) in enumerate(
+            _iter_batches(source, batch_size)
+        ):
+            print(f"Batch {i}")
+            writer.append(_chunk_metadata(metadata, chunk_counts), embeddings)
+    return writer.n_rows
+
+
+def get_store_dir(embeddings_file):
+    """Store next to a publang embeddings file, e.g. x.csv -> x.embeddings."""
+    embeddings_file = pathlib.Path(embeddings_file)
+    return embeddings_file.with_suffix(".embeddings")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "embeddings_files",
+        help="CSV or Parquet files of embeddings written by publang.",
+        nargs="+",
+        type=str,
+    )
+    parser.add_argument("--batch_size", type=int, default=10000)
+    args = parser.parse_args()
+
+    for embeddings_file in args.embeddings_files:
+        store_dir = get_store_dir(embeddings_file)
+        n_chunks = migrate_embeddings(
+            embeddings_file, store_dir, args.batch_size
+        )
+        print(f"{n_chunks} chunks written to {store_dir}")
@@ -1,63 +1,166 @@
-import pprint
-import pandas as pd
-from publang.evaluate import score_columns, hungarian_match_compare 
-import utils
-
-# Load evaluation annotationsunique_ids = 
-
-annotations = pd.read_csv(utils.get_outputs_dir() / 'evaluation_labels.csv')
-predictions_gpt = pd.read_csv(utils.get_outputs_dir() / 'gpt' / 'eval_participant_demographics_gpt_tokens-2000_clean.csv')
-
-predictions_gpt = predictions_gpt[predictions_gpt.pmcid.isin(annotations.pmcid.unique())]
-
+#! /usr/bin/env python3
+"""Evaluate all GPT predictions against the evaluation annotations.
+
+Scores every data/outputs/gpt/eval_*_clean.csv file (see gpt_evaluation.py).
+The result of each file, including publang's scores, is saved to
+data/outputs/gpt/evaluation/<file name>.json, and a table of all files, with
+the model and token budget parsed from the file names, to
+data/outputs/gpt/evaluation_metrics.csv. The table has one row per file: the
+"summary" metrics, then publang's scores flattened into columns named like
+"res_mean.count" (output, then column). Files whose content (and the
+annotations) did not change since their result was saved are not evaluated
+again.
+"""
+import argparse
+import json
+import pathlib
+import re
 
-def _evaluate(annotations, predictions):
-
-    # Match compare
-    match_compare = hungarian_match_compare(annotations, predictions)
-
-    # Compare by columns (matched accuracy)
-    res_mean, res_sums, counts = score_columns(annotations, predictions)
-
-    # Subset to only pmcids in predictions
-    diff = set(set(annotations.pmcid.unique()) - set(predictions.pmcid.unique()))
-    annotations = annotations[annotations.pmcid.isin(predictions.pmcid.unique())]
+import pandas as pd
 
-    # Compute overlap of pmcids
-    pred_n_groups = predictions.groupby('pmcid').size()
-    n_groups = annotations.groupby('pmcid').size()
-    correct_n_groups = (n_groups == pred_n_groups)
-    more_groups_pred = (n_groups < pred_n_groups)
-    less_groups_pred = (n_groups > pred_n_groups)
+import gpt_evaluation
+import utils
 
-    print(f"Exact match # of groups: {correct_n_groups.mean():.2f}\n",
-    f"More groups predicted: {more_groups_pred.mean():.2f}\n",
-    f"Less groups predicted: {less_groups_pred.mean():.2f}\n",
-    f"Missing pmcids: {diff}\n"
+_FILE_NAME_PATTERN = re.compile(
+    r"eval_participant_demographics_(?P<model>.+)_tokens-(?P<n_tokens>\d+)"
+    r"_clean\.csv"
+)
+
+
+def parse_file_name(file_name):
+    """(model, token budget) of a predictions file name."""
+    match = _FILE_NAME_PATTERN.fullmatch(file_name)
+    if match is None:
+        return file_name, None
+    return match.group("model"), int(match.group("n_tokens"))
+
+
+def _load_result(result_file):
+    try:
+        return json.loads(result_file.read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def evaluate_files(annotations_file, predictions_files, results_dir, n_jobs):
+    """Evaluate the predictions files whose saved result is out of date.
+
+    Returns a dict mapping the file names to their results.
+    """
+    results_dir.mkdir(parents=True, exist_ok=True)
+    labels_hash = utils.file_sha256(annotations_file)
+    results, todo = {}, {}
+    for predictions_file in predictions_files:
+        key = {
+            "file_hash": utils.file_sha256(predictions_file),
+            "labels_hash": labels_hash,
+            "metrics_version": gpt_evaluation.METRICS_VERSION,
+        }
+        name = predictions_file.name
+        result = _load_result(results_dir / f"{name}.json")
+        if result is not None and all(
+            result.get(column) == value for column, value in key.items()
+        ):
+            results[name] = result
+            continue
+        predictions = pd.read_csv(predictions_file)
+        if not len(predictions):
+            print(f"No predictions in {predictions_file}, skipping it")
+            continue
+        todo[name] = (predictions_file, predictions, key)
+    print(f"{len(results)} files up to date, evaluating {len(todo)}")
+    if todo:
+        new_results = gpt_evaluation.evaluate(
+            pd.read_csv(annotations_file),
+            {name: predictions for name, (_, predictions, _) in todo.items()},
+            n_jobs=n_jobs,
+        )
+        for name, (predictions_file, _, key) in todo.items():
+            results[name] = {
+                "file": name,
+                "path": str(predictions_file.resolve()),
+                **key,
+                **new_results[name],
+            }
+            (results_dir / f"{name}.json").write_text(
+                json.dumps(results[name], indent=2), "utf-8"
+            )
+    return results
+
+
+def _flatten(value, prefix):
+    """{prefix.key.subkey: value} for the leaves of nested dicts."""
+    if not isinstance(value, dict):
+        return {prefix: value}
+    flat = {}
+    for key, item in value.items():
+        flat.update(_flatten(item, f"{prefix}.{key}"))
+    return flat
+
+
+def metrics_table(results):
+    """One row of metrics per file, sorted by model and tokens."""
+    rows = []
+    for name, result in results.items():
+        model, n_tokens = parse_file_name(name)
+        row = {
+            "model": model,
+            "n_tokens": n_tokens,
+            "file": name,
+            **result["summary"],
+        }
+        for output in gpt_evaluation.PUBLANG_OUTPUTS:
+            row.update(_flatten(result[output], output))
+        rows.append(row)
+    table = pd.DataFrame(rows).sort_values(["model", "n_tokens", "file"])
+    for column in "n_tokens", "n_pmcids", "missing_pmcids":
+        table[column] = table[column].astype("Int64")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "predictions_files",
+        nargs="*",
+        help="Default is all data/outputs/gpt/eval_*_clean.csv files.",
     )
-
-    # Compare by columns (matched accuracy)
-    print("Column wise comparison of predictions and annotations (error):\n")
-    pprint.pprint(match_compare)
-
-    # Compare by columns (count of pmcids with overlap)
-    print("\nPercentage response given by pmcid:\n")
-    pprint.pprint(counts)
-
-
-    # Compare by columns (summed mean percentage error on sum by pmcid)
-    print("\nSummed Mean percentage error:\n")
-    pprint.pprint(res_mean)
-
-    # Compare by columns (summed mean percentage error on mean by pmcid)
-    print("\nAveraged Mean percentage error:\n")
-    pprint.pprint(res_sums)
-
-    return match_compare, res_mean, res_sums, counts
-
-
-print("Evaluate GPT with smaller chunk size (2000)")
-match_compare, res_mean, res_sums, counts = _evaluate(annotations, predictions_gpt)
-
-# print("Evaluate GPT with smaller chunk size (4000)")
-# match_compare, res_mean, res_sums, counts = _evaluate(annotations, predictions_gpt_4000)
\ No newline at end of file
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of worker processes.",
+        type=int,
+        default=1,
+    )
+    args = parser.parse_args()
+
+    gpt_dir = utils.get_outputs_dir() / "gpt"
+    results_dir = gpt_dir / "evaluation"
+    if args.predictions_files:
+        predictions_files = list(map(pathlib.Path, args.predictions_files))
+    else:
+        predictions_files = sorted(gpt_dir.glob("eval_*_clean.csv"))
+    evaluate_files(
+        utils.get_outputs_dir() / "evaluation_labels.csv",
+        predictions_files,
+        results_dir,
+        args.jobs,
+    )
+    # the summary covers all saved results whose predictions still exist
+    results = {}
+    for result_file in sorted(results_dir.glob("*.json")):
+        result = _load_result(result_file)
+        if (
+            result is not None
+            and result["metrics_version"] == gpt_evaluation.METRICS_VERSION
+            and pathlib.Path(result["path"]).is_file()
+        ):
+            results[result["file"]] = result
+    if not results:
+        print("No predictions to evaluate.")
+    else:
+        table = metrics_table(results)
+        table.to_csv(gpt_dir / "evaluation_metrics.csv", index=False)
+        with pd.option_context("display.width", 200):
+            print(table.to_string(index=False))
+        print(f"Scores of each file are in {results_dir}")
@@ -1,8 +1,78 @@
+"""Extract participant demographics from the pubget text.csv.
+
+The first time (or with --full, or when the extractor changed), all
+articles are extracted, in chunks processed in parallel (see
+`sharded_extraction.py`). Afterwards, only articles that are new, or whose
+text changed, are extracted and appended, in batches; see
+`incremental_extraction.py`. An interrupted incremental run resumes from the
+last completed batch.
+"""
+import argparse
+
 from pubextract import participants
 
+import incremental_extraction
+import sharded_extraction
 import utils
 
+EXTRACTOR_NAME = "pubextract.participants.extract_from_dataset"
 
-participants.extract_from_dataset(
-    utils.get_pubget_data_dir() / "text.csv", utils.get_demographics_file()
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--batch_size",
+    help="Number of articles extracted at a time: rows per chunk of a full "
+    "extraction, or per committed batch of an incremental one.",
+    type=int,
+    default=1000,
+)
+parser.add_argument(
+    "--full",
+    help="Extract all articles again, discarding the existing output.",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    "--n_jobs",
+    help="Number of worker processes for a full extraction.",
+    type=int,
+    default=1,
 )
+args = parser.parse_args()
+
+text_file = utils.get_pubget_data_dir() / "text.csv"
+output_file = utils.get_demographics_file()
+manifest_file = utils.get_demographics_manifest_file()
+# the records also hold scanning_horizon's sample size
+extractor_version = (
+    f"{utils.get_package_version('pubextract')}"
+    f"+scanning_horizon-{incremental_extraction.scanning_horizon_version()}"
+)
+
+if args.full or not incremental_extraction.has_manifest(
+    manifest_file, EXTRACTOR_NAME, extractor_version
+):
+    # the old manifest must not outlive the output it describes, in case we
+    # stop after replacing the output; the new one is written afterwards
+    manifest_file.unlink(missing_ok=True)
+    articles = sharded_extraction.extract_sharded(
+        text_file,
+        output_file,
+        participants.extract_from_dataset,
+        n_jobs=args.n_jobs,
+        chunksize=args.batch_size,
+    )
+    incremental_extraction.write_manifest(
+        manifest_file, output_file, EXTRACTOR_NAME, extractor_version, articles
+    )
+    n_extracted = len(articles)
+else:
+    n_extracted = incremental_extraction.extract_incrementally(
+        text_file,
+        output_file,
+        manifest_file,
+        participants.extract_from_dataset,
+        EXTRACTOR_NAME,
+        extractor_version,
+        batch_size=args.batch_size,
+    )
+print(f"Extracted {n_extracted} articles into {output_file}")
@@ -1,11 +1,28 @@
+import argparse
 import pandas as pd
 import os
-from publang.pipelines import extract_gpt_demographics, clean_gpt_demo_predictions
+from publang.pipelines import clean_gpt_demo_predictions
 from labelrepo.projects.participant_demographics import get_participant_demographics
 from labelrepo import database
 
+import gpt_extraction
+import llm_cache
 import utils
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--replay_only",
+    help="Only use cached API responses; fail if one is missing.",
+    action="store_true",
+)
+parser.add_argument(
+    "--max_cache_age_days",
+    help="Delete cached responses unused for this many days.",
+    type=float,
+    default=None,
+)
+args = parser.parse_args()
+
 api_key = os.environ.get('OPENAI_API_KEY', None)
 
 ### Training documents
@@ -13,10 +30,6 @@ api_key = os.environ.get('OPENAI_API_KEY', None)
 subgroups = get_participant_demographics()
 jerome_pd = subgroups[(subgroups.project_name == 'participant_demographics') & \
                       (subgroups.annotator_name == 'Jerome_Dockes')]
-subset_cols = ['count', 'diagnosis', 'group_name', 'subgroup_name', 'male count',
-       'female count', 'age mean', 'age minimum', 'age maximum',
-       'age median', 'pmcid']
-jerome_pd_subset = jerome_pd[subset_cols].sort_values('pmcid')
 
 # database.make_database()
 
@@ -27,17 +40,31 @@ docs = pd.read_sql(
 )
 docs = docs[docs.pmcid.isin(jerome_pd.pmcid)].to_dict(orient='records')
 
-for n_tokens in [2000, 4000]:
+# API responses are cached (see llm_cache.py), so running again on the same
+# documents does not call the API
+with llm_cache.cached_openai_api(
+    utils.get_llm_cache_file(),
+    replay_only=args.replay_only,
+    max_age_seconds=None
+    if args.max_cache_age_days is None
+    else args.max_cache_age_days * 24 * 3600,
+) as proxy:
+    for n_tokens in [2000, 4000]:
+
+        predictions_path = utils.get_outputs_dir() / 'gpt' / f'eval_participant_demographics_gpt4-1106_tokens-{n_tokens}.csv'
+        clean_predictions_path = utils.get_outputs_dir() / 'gpt' / f'eval_participant_demographics_gpt4-1106_tokens-{n_tokens}_clean.csv'
 
-    predictions_path = utils.get_outputs_dir() / 'gpt' / f'eval_participant_demographics_gpt4-1106_tokens-{n_tokens}.csv'
-    clean_predictions_path = utils.get_outputs_dir() / 'gpt' / f'eval_participant_demographics_gpt4-1106_tokens-{n_tokens}_clean.csv'
-    embeddings_path = utils.get_outputs_dir() / 'gpt' / f'eval_embeddings_tokens-{n_tokens}-1106.parquet'
+        # Extract, one document per call with adaptive concurrency
+        predictions = gpt_extraction.extract_all(
+            docs[0:10],
+            gpt_extraction.publang_extractor(
+                api_key, n_tokens, extraction_model_name='gpt-4-1106-preview'
+            ),
+        )
 
-    # Extract
-    predictions = extract_gpt_demographics(
-        articles=docs[0:10], output_path=predictions_path, api_key=api_key, max_tokens=n_tokens, num_workers=1,
-        embeddings_path=embeddings_path, extraction_model_name='gpt-4-1106-preview'
-    )
+        clean_gpt_demo_predictions(predictions).to_csv(clean_predictions_path, index=False)
+        predictions.to_csv(predictions_path, index=False)
 
-    clean_gpt_demo_predictions(predictions).to_csv(clean_predictions_path, index=False)
-    predictions.to_csv(predictions_path, index=False)
\ No newline at end of file
+print(f"API responses: {dict(proxy.stats)}")
+if args.replay_only and proxy.stats["misses"]:
+    raise SystemExit("Some API responses were not in the cache.")
@@ -1,24 +1,68 @@
-import utils
-import json
+import argparse
 import os
-import pandas as pd
-from publang.pipelines import extract_gpt_demographics, clean_gpt_demo_predictions
 
-with open(utils.get_repo_data_dir() / 'fmri_documents.jsonl', 'r') as f:
-    docs = [json.loads(line) for line in f]
+from publang.pipelines import clean_gpt_demo_predictions
+
+import gpt_extraction
+import rate_limit
+import utils
 
 MAX_TOKENS = 4000
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--max_workers",
+    help="Maximum number of concurrent requests; the actual number adapts "
+    "to the API's latency and rate-limit errors.",
+    type=int,
+    default=32,
+)
+parser.add_argument(
+    "--requests_per_minute",
+    help="Maximum number of API requests per minute.",
+    type=float,
+    default=None,
+)
+parser.add_argument(
+    "--tokens_per_minute",
+    help="Maximum number of tokens per minute.",
+    type=float,
+    default=None,
+)
+parser.add_argument(
+    "--base_url",
+    help="OpenAI-compatible API, e.g. one served by openai_stub_server.py.",
+    default=None,
+)
+args = parser.parse_args()
+
+if args.base_url is not None:
+    os.environ["OPENAI_BASE_URL"] = args.base_url
 api_key = os.environ.get('OPENAI_API_KEY', None)
 
 predictions_path = utils.get_outputs_dir() / 'gpt' / f'all_participant_demographics_gpt_tokens-{MAX_TOKENS}.csv'
 clean_predictions_path = utils.get_outputs_dir() / 'gpt' / f'all_participant_demographics_gpt_tokens-{MAX_TOKENS}_clean.csv'
-embeddings_path = utils.get_outputs_dir() / 'gpt' / f'all_embeddings_tokens-{MAX_TOKENS}.parquet'
+checkpoint_path = predictions_path.with_suffix(".checkpoint.jsonl")
 
-# Extract
-predictions = extract_gpt_demographics(
-    articles=docs, output_path=predictions_path, api_key=api_key, max_tokens=MAX_TOKENS, num_workers=6,
-    embeddings_path=embeddings_path
+# Extract, resuming from the checkpoint
+checkpoint = gpt_extraction.Checkpoint(checkpoint_path)
+stats = gpt_extraction.run_extraction(
+    gpt_extraction.iter_documents(
+        utils.get_repo_data_dir() / 'fmri_documents.jsonl'
+    ),
+    gpt_extraction.publang_extractor(api_key, MAX_TOKENS),
+    checkpoint,
+    limiter=rate_limit.RateLimiter(
+        args.requests_per_minute, args.tokens_per_minute
+    ),
+    max_workers=args.max_workers,
+    n_tokens=lambda doc: gpt_extraction.estimate_tokens(doc, MAX_TOKENS),
+    report_every=60,
 )
+print(stats)
+if stats.get("failed"):
+    print("Some documents failed; run again to retry them.")
 
+predictions = checkpoint.load_predictions()
 predictions.to_csv(predictions_path, index=False)
-clean_gpt_demo_predictions(predictions).to_csv(clean_predictions_path, index=False)
\ No newline at end of file
+clean_gpt_demo_predictions(predictions).to_csv(clean_predictions_path, index=False)
@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+"""Inspect, prune or invalidate the local cache of extraction results.
+
+The cache (data/cache/extraction_cache.sqlite) stores extraction results
+keyed by document text hash, extractor name and extractor version. It is
+used by annotate.py and extract_n_for_labelled_papers.py to skip documents
+that have already been processed.
+"""
+import argparse
+import json
+
+import utils
+
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(dest="command", required=True)
+subparsers.add_parser("stats", help="Show the entries of each extractor.")
+clear_parser = subparsers.add_parser(
+    "clear",
+    help="Delete cached results (all of them, or those of one extractor).",
+)
+clear_parser.add_argument(
+    "-e",
+    "--extractor",
+    help="Only delete results of this extractor, "
+    "e.g. 'scanning_horizon.SampleSizeExtractor'.",
+    type=str,
+    default=None,
+)
+clear_parser.add_argument(
+    "-v",
+    "--version",
+    help="Only delete results of this extractor version.",
+    type=str,
+    default=None,
+)
+evict_parser = subparsers.add_parser(
+    "evict", help="Delete least recently used entries above a size."
+)
+evict_parser.add_argument(
+    "max_size_mb", help="Size to shrink the cache to, in MB.", type=float
+)
+
+args = parser.parse_args()
+
+with utils.get_extraction_cache() as cache:
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+        print(f"Total size: {cache.size_bytes() / 1e6:.1f} MB")
+    elif args.command == "clear":
+        if args.version is not None and args.extractor is None:
+            parser.error("--version requires --extractor")
+        n_deleted = cache.clear(args.extractor, args.version)
+        print(f"{n_deleted} entries deleted.")
+    else:
+        n_deleted = cache.evict(int(args.max_size_mb * 1e6))
+        print(f"{n_deleted} entries deleted.")
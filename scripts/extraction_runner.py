@@ -0,0 +1,158 @@
+"""Run several sample-size extractors over documents in a single pass.
+
+Each labelbuddy document is parsed, sliced and hashed once, into a
+`Document`, and batches of documents go through every registered extractor.
+Extractors share a common interface:
+
+- `name`: the column name in the output table,
+- `cache_id`: (name, version) under which results are cached, or None for
+  extractors that are not worth caching,
+- `extract_batch(documents)`: one result per `Document`.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+import itertools
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+from scanning_horizon import MISSING, SampleSizeExtractor
+
+import utils
+
+
+class Document(NamedTuple):
+    pmcid: int
+    doc: dict
+    abstract: str
+    doc_hash: Optional[str]
+
+    @classmethod
+    def from_labelbuddy_doc(cls, doc, with_hash=True):
+        abs_start, abs_end = doc["metadata"]["field_positions"]["abstract"]
+        return cls(
+            doc["metadata"]["pmcid"],
+            doc,
+            doc["text"][abs_start:abs_end],
+            utils.labelbuddy_doc_hash(doc) if with_hash else None,
+        )
+
+
+class ScanningHorizonExtractor:
+    name = "scanning_horizon"
+
+    def __init__(self, extractor=None):
+        self.extractor = (
+            SampleSizeExtractor() if extractor is None else extractor
+        )
+        self.cache_id = self.extractor.cache_id
+
+    def extract_batch(self, documents):
+        return [self.extractor.n_participants(d.abstract) for d in documents]
+
+
+class PubextractExtractor:
+    name = "pubextract.participants"
+
+    def __init__(self):
+        self.cache_id = (
+            f"{self.name}.n_participants_from_labelbuddy_docs",
+            utils.get_package_version("pubextract"),
+        )
+
+    def extract_batch(self, documents):
+        from pubextract import participants
+
+        return participants.n_participants_from_labelbuddy_docs(
+            [d.doc for d in documents]
+        )
+
+
+class PredictionsTableExtractor:
+    """Total count per pmcid from a CSV of (pmcid, count) group predictions.
+
+    The CSV is read once, when the extractor is created.
+    """
+
+    cache_id = None
+
+    def __init__(self, name, predictions_path):
+        self.name = name
+        predictions = pd.read_csv(predictions_path, usecols=["pmcid", "count"])
+        self.counts = predictions.groupby("pmcid")["count"].sum().to_dict()
+
+    def extract_batch(self, documents):
+        return [self.counts.get(d.pmcid) for d in documents]
+
+
+def _extract(extractor, documents):
+    return extractor.extract_batch(documents)
+
+
+def _json_value(value):
+    """Python scalar for a numpy scalar, which `json` cannot serialize."""
+    return value.item() if hasattr(value, "item") else value
+
+
+def run_extractors(docs, extractors, cache=None, batch_size=200, n_jobs=1):
+    """Table of results, one column per extractor and one row per document.
+
+    `docs` is an iterable of labelbuddy documents, traversed once. If a
+    `cache` (`scanning_horizon.ExtractionCache`) is given, extractors with a
+    `cache_id` only see the documents missing from it. With `n_jobs` > 1,
+    the extractors run in parallel, in separate processes.
+    """
+    columns = {extractor.name: [] for extractor in extractors}
+    pmcids = []
+    executor = ProcessPoolExecutor(n_jobs) if n_jobs > 1 else None
+    try:
+        doc_iter = iter(docs)
+        while True:
+            batch = [
+                Document.from_labelbuddy_doc(doc, with_hash=cache is not None)
+                for doc in itertools.islice(doc_iter, batch_size)
+            ]
+            if not batch:
+                break
+            pmcids.extend(d.pmcid for d in batch)
+            for extractor, results in zip(
+                extractors, _run_batch(batch, extractors, cache, executor)
+            ):
+                columns[extractor.name].extend(results)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.commit()
+    return pd.DataFrame(columns, index=pd.Index(pmcids, name="pmcid"))
+
+
+def _run_batch(batch, extractors, cache, executor):
+    all_results, pending = [], []
+    for extractor in extractors:
+        results = [MISSING] * len(batch)
+        if cache is not None and extractor.cache_id is not None:
+            results = [
+                cache.get(*extractor.cache_id, key=document.doc_hash)
+                for document in batch
+            ]
+        missing = [i for i, result in enumerate(results) if result is MISSING]
+        missing_docs = [batch[i] for i in missing]
+        if missing_docs and executor is not None:
+            new_results = executor.submit(_extract, extractor, missing_docs)
+        else:
+            new_results = Future()
+            new_results.set_result(
+                extractor.extract_batch(missing_docs) if missing_docs else []
+            )
+        all_results.append(results)
+        pending.append((extractor, missing, new_results))
+    for (extractor, missing, new_results), results in zip(
+        pending, all_results
+    ):
+        for i, result in zip(missing, new_results.result()):
+            # fresh results are the same as cached ones
+            result = _json_value(result)
+            results[i] = result
+            if cache is not None and extractor.cache_id is not None:
+                cache.put(*extractor.cache_id, result, key=batch[i].doc_hash)
+    return all_results
@@ -0,0 +1,141 @@
+"""Scores of sample size extractors, with bootstrap confidence intervals.
+
+All metrics of all extractors are computed at once on arrays of shape
+(n_replicates, n_articles, n_extractors): a single matrix of resampled
+article indices is drawn, and each extractor only uses the articles for
+which it extracted a sample size (the others are masked with NaN).
+Percentiles are computed by sorting along the articles axis, NaNs last, and
+interpolating between the two nearest ranks as `numpy.percentile` does.
+
+The point estimates are the same computations on the original sample (the
+identity resampling), and match the scikit-learn metrics.
+"""
+import numpy as np
+
+# metrics with a confidence interval; the others are counts
+BOOTSTRAPPED_METRICS = (
+    "true_median",
+    "estimated_median",
+    "percentile_90_abs_error",
+    "percentile_80_abs_error",
+    "r2_score",
+    "mean_absolute_error",
+    "median_absolute_error",
+    "mean_absolute_percentage_error",
+)
+
+
+def _masked_percentile(values, counts, q):
+    """Percentile along axis 1 of `values` sorted with NaNs last.
+
+    `counts` holds the number of non-NaN values; the result is NaN where it
+    is 0.
+    """
+    position = q / 100 * np.maximum(counts - 1, 0)
+    low = np.floor(position).astype(int)
+    high = np.ceil(position).astype(int)
+    low_values = np.take_along_axis(values, low[:, None], axis=1)[:, 0]
+    high_values = np.take_along_axis(values, high[:, None], axis=1)[:, 0]
+    result = low_values + (high_values - low_values) * (position - low)
+    return np.where(counts > 0, result, np.nan)
+
+
+def compute_metrics(y_true, y_pred):
+    """Metrics for each replicate and extractor.
+
+    `y_true` has shape (n_replicates, n_articles); `y_pred` has shape
+    (n_replicates, n_articles, n_extractors), NaN where an extractor found
+    nothing. Returns a dict of arrays of shape (n_replicates, n_extractors)
+    (n_replicates for "true_median").
+    """
+    n_replicates, n_articles, n_extractors = y_pred.shape
+    detected = ~np.isnan(y_pred)
+    counts = detected.sum(axis=1)
+    true = np.broadcast_to(y_true[:, :, None], y_pred.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.where(detected, true - y_pred, np.nan)
+        abs_errors = np.abs(errors)
+        relative_errors = abs_errors / np.maximum(
+            np.abs(true), np.finfo("float64").eps
+        )
+        true_mean = np.where(detected, true, 0).sum(axis=1) / counts
+        ss_tot = np.nansum(
+            np.where(detected, true - true_mean[:, None, :], np.nan) ** 2,
+            axis=1,
+        )
+        ss_res = np.nansum(errors**2, axis=1)
+        metrics = {
+            "n_detections": counts,
+            "n_errors": (detected & (errors != 0)).sum(axis=1),
+            "r2_score": 1 - ss_res / ss_tot,
+            "mean_absolute_error": np.nansum(abs_errors, axis=1) / counts,
+            "mean_absolute_percentage_error": np.nansum(
+                relative_errors, axis=1
+            )
+            / counts,
+        }
+
+    def percentile(values, q):
+        # (replicates, articles, extractors) -> (replicates × extractors,
+        # articles), sorted with NaNs last
+        flat = np.sort(values.transpose(0, 2, 1), axis=2).reshape(
+            -1, n_articles
+        )
+        return _masked_percentile(flat, counts.ravel(), q).reshape(
+            n_replicates, n_extractors
+        )
+
+    metrics["true_median"] = _masked_percentile(
+        np.sort(y_true, axis=1), np.full(n_replicates, n_articles), 50
+    )
+    metrics["estimated_median"] = percentile(
+        np.where(detected, y_pred, np.nan), 50
+    )
+    metrics["median_absolute_error"] = percentile(abs_errors, 50)
+    metrics["percentile_90_abs_error"] = percentile(relative_errors, 90)
+    metrics["percentile_80_abs_error"] = percentile(relative_errors, 80)
+    return metrics
+
+
+def score_extractors(
+    samples, n_replicates=10000, confidence_level=0.95, random_state=0
+):
+    """Scores of each extractor, with bootstrap confidence intervals.
+
+    `samples` has the annotated sample sizes in its first column and one
+    column per extractor. Articles are resampled with replacement
+    `n_replicates` times. Returns a dict mapping extractor names to their
+    scores, which include "confidence_intervals": {metric: [low, high]}.
+    """
+    y_true = samples.iloc[:, 0].to_numpy(dtype=float)
+    y_pred = samples.iloc[:, 1:].to_numpy(dtype=float)
+    n_articles = len(y_true)
+    point = compute_metrics(y_true[None, :], y_pred[None, :, :])
+    rng = np.random.default_rng(random_state)
+    resampled = rng.integers(0, n_articles, size=(n_replicates, n_articles))
+    replicates = compute_metrics(y_true[resampled], y_pred[resampled])
+    alpha = (1 - confidence_level) / 2
+    all_scores = {}
+    for i, extractor_name in enumerate(samples.columns[1:]):
+        scores = {
+            "n_detections": int(point["n_detections"][0, i]),
+            "n_annotations": n_articles,
+            "true_median": float(point["true_median"][0]),
+        }
+        scores["estimated_median"] = float(point["estimated_median"][0, i])
+        scores["n_errors"] = int(point["n_errors"][0, i])
+        for metric_name in BOOTSTRAPPED_METRICS[2:]:
+            scores[metric_name] = float(point[metric_name][0, i])
+        intervals = {}
+        for metric_name in BOOTSTRAPPED_METRICS:
+            values = replicates[metric_name]
+            values = values if values.ndim == 1 else values[:, i]
+            intervals[metric_name] = [
+                float(v)
+                for v in np.nanquantile(values, [alpha, 1 - alpha])
+            ]
+        scores["confidence_level"] = confidence_level
+        scores["n_bootstrap_replicates"] = n_replicates
+        scores["confidence_intervals"] = intervals
+        all_scores[extractor_name] = scores
+    return all_scores
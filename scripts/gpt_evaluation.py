@@ -0,0 +1,112 @@
+"""Score GPT predictions of participant demographics against annotations.
+
+Each predictions file is scored as `evaluate_demographics_gpt.py` always
+did, with publang's `hungarian_match_compare` and `score_columns`, and the
+number of predicted vs annotated groups per pmcid. The result of a file is a
+JSON-serializable dict:
+
+- "summary": n_pmcids, missing_pmcids (the number of annotated pmcids
+  without predictions), exact_n_groups, more_groups and less_groups (the
+  fraction of pmcids with as many, more or fewer predicted groups than
+  annotated ones);
+- "missing_pmcids": the annotated pmcids without predictions;
+- "match_compare", "res_mean", "res_sums", "counts": publang's outputs.
+
+Files are processed by a pool of forked workers, which share the tables
+loaded once by the main process.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+# outputs of publang's scoring functions, in the result of a file
+PUBLANG_OUTPUTS = ("match_compare", "res_mean", "res_sums", "counts")
+# bump when the results change, to invalidate results saved by
+# `evaluate_demographics_gpt.py`
+METRICS_VERSION = 2
+
+# tables loaded by the main process before forking the workers:
+# "annotations", and "predictions", which maps file names to tables
+_SHARED_DATA = {}
+
+
+def evaluate_predictions(annotations, predictions):
+    """Result for one table of predictions (see the module docstring)."""
+    from publang.evaluate import hungarian_match_compare, score_columns
+
+    predictions = predictions[
+        predictions.pmcid.isin(annotations.pmcid.unique())
+    ]
+    match_compare = hungarian_match_compare(annotations, predictions)
+    res_mean, res_sums, counts = score_columns(annotations, predictions)
+
+    missing = set(annotations.pmcid.unique()) - set(
+        predictions.pmcid.unique()
+    )
+    annotations = annotations[
+        annotations.pmcid.isin(predictions.pmcid.unique())
+    ]
+    pred_n_groups = predictions.groupby("pmcid").size()
+    n_groups = annotations.groupby("pmcid").size()
+    summary = {
+        "n_pmcids": len(n_groups),
+        "missing_pmcids": len(missing),
+        "exact_n_groups": (n_groups == pred_n_groups).mean(),
+        "more_groups": (n_groups < pred_n_groups).mean(),
+        "less_groups": (n_groups > pred_n_groups).mean(),
+    }
+    return _to_json(
+        {
+            "summary": summary,
+            "missing_pmcids": sorted(missing),
+            "match_compare": match_compare,
+            "res_mean": res_mean,
+            "res_sums": res_sums,
+            "counts": counts,
+        }
+    )
+
+
+def _to_json(value):
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        value = value.to_dict()
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(item) for item in value]
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _evaluate_file(file_name):
+    return file_name, evaluate_predictions(
+        _SHARED_DATA["annotations"], _SHARED_DATA["predictions"][file_name]
+    )
+
+
+def evaluate(annotations, predictions, n_jobs=1):
+    """Results of each predictions table (see the module docstring).
+
+    `predictions` maps file names to DataFrames of predicted groups. Returns
+    a dict mapping file names to results.
+    """
+    _SHARED_DATA["annotations"] = annotations
+    _SHARED_DATA["predictions"] = predictions
+    can_fork = "fork" in multiprocessing.get_all_start_methods()
+    try:
+        if n_jobs == 1 or len(predictions) < 2 or not can_fork:
+            results = list(map(_evaluate_file, predictions))
+        else:
+            with ProcessPoolExecutor(
+                min(n_jobs, len(predictions)),
+                mp_context=multiprocessing.get_context("fork"),
+            ) as executor:
+                results = list(executor.map(_evaluate_file, predictions))
+    finally:
+        _SHARED_DATA.clear()
+    return dict(results)
@@ -0,0 +1,211 @@
+"""Resumable extraction of participant demographics with GPT.
+
+Documents are streamed from a JSONL file and sent, one per call, to an
+extraction function (by default publang's `extract_gpt_demographics`). The
+number of concurrent calls adapts to the API's latency and rate-limit errors
+(see adaptive_dispatch.py), and calls are paced by a
+`rate_limit.RateLimiter`. The predictions for each document are appended to
+a checkpoint file (JSONL, one line per pmcid) as soon as they are
+available; documents already in the checkpoint are skipped, so an
+interrupted run resumes where it stopped.
+
+To test offline, run `openai_stub_server.py` and point the openai client
+to it with the OPENAI_BASE_URL environment variable.
+"""
+import collections
+import json
+import math
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+import adaptive_dispatch
+
+# rough number of tokens in the prompt and answer, on top of the chunk of
+# text sent with each chat request
+_PROMPT_TOKENS = 1000
+# requests made for one document: embedding its chunks, then extraction
+_REQUESTS_PER_DOCUMENT = 2
+
+
+def iter_documents(docs_file):
+    """Yield the documents of a JSONL file, reading one line at a time."""
+    with open(docs_file, encoding="utf-8") as docs_f:
+        for line in docs_f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Checkpoint:
+    """Append-only JSONL file of {"pmcid": ..., "predictions": [...]}.
+
+    A line that was being written when a previous run stopped is discarded
+    when the checkpoint is opened.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.pmcids = set()
+        self._lock = threading.Lock()
+        valid_size = 0
+        if self.path.is_file():
+            with open(self.path, "rb") as checkpoint_f:
+                for line in checkpoint_f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    self.pmcids.add(record["pmcid"])
+                    valid_size += len(line)
+        self.path.touch()
+        with open(self.path, "r+b") as checkpoint_f:
+            checkpoint_f.truncate(valid_size)
+
+    def __contains__(self, pmcid):
+        return pmcid in self.pmcids
+
+    def __len__(self):
+        return len(self.pmcids)
+
+    def append(self, pmcid, predictions):
+        line = json.dumps({"pmcid": pmcid, "predictions": predictions})
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as checkpoint_f:
+                checkpoint_f.write(line + "\n")
+                checkpoint_f.flush()
+                os.fsync(checkpoint_f.fileno())
+            self.pmcids.add(pmcid)
+
+    def load_predictions(self):
+        """All predictions as a DataFrame, one row per participant group."""
+        rows = []
+        for record in iter_documents(self.path):
+            for prediction in record["predictions"]:
+                rows.append({"pmcid": record["pmcid"], **prediction})
+        return pd.DataFrame(rows)
+
+
+def estimate_tokens(doc, max_tokens):
+    """Tokens used by a document: embedding its text and one chat request."""
+    return len(doc["text"]) // 4 + max_tokens + _PROMPT_TOKENS
+
+
+def run_extraction(
+    docs,
+    extract_document,
+    checkpoint,
+    limiter=None,
+    max_workers=32,
+    n_tokens=lambda doc: 0,
+    report_every=None,
+):
+    """Extract predictions for the documents missing from the checkpoint.
+
+    `extract_document(doc)` returns a list of JSON-serializable predictions.
+    Documents are dispatched by an `adaptive_dispatch.AdaptiveDispatcher`,
+    with up to `max_workers` concurrent calls. Before each call,
+    `limiter.acquire` is given the number of requests and the tokens
+    (`n_tokens(doc)`) it will use; this wait is not counted as latency by
+    the dispatcher. Documents whose extraction fails are reported and left
+    out of the checkpoint, to be retried next time.
+    Returns counts of extracted, skipped and failed documents, retries, and
+    the elapsed time.
+    """
+    stats = collections.Counter()
+    start = time.perf_counter()
+
+    def process(doc):
+        checkpoint.append(doc_pmcid(doc), extract_document(doc))
+
+    def wait_for_limiter(doc):
+        limiter.acquire(_REQUESTS_PER_DOCUMENT, n_tokens(doc))
+
+    def todo():
+        for doc in docs:
+            if doc_pmcid(doc) in checkpoint:
+                stats["skipped"] += 1
+            else:
+                yield doc
+
+    def on_error(doc, error):
+        print(f"Extraction failed for pmcid {doc_pmcid(doc)}:")
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    dispatcher = adaptive_dispatch.AdaptiveDispatcher(
+        process,
+        adaptive_dispatch.AIMDLimit(maximum=max_workers),
+        before_call=None if limiter is None else wait_for_limiter,
+        n_tokens=n_tokens,
+        report_every=report_every,
+    )
+    metrics = dispatcher.run(todo(), lambda doc, result: None, on_error)
+    stats["extracted"] = metrics["completed"]
+    for key in "failed", "retries", "throttled":
+        stats[key] = metrics[key]
+    stats["seconds"] = time.perf_counter() - start
+    return dict(stats)
+
+
+def extract_all(docs, extract_document, **kwargs):
+    """Predictions for all `docs` as a DataFrame, without a checkpoint file.
+
+    `kwargs` are passed to `run_extraction`.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint = Checkpoint(pathlib.Path(tmp_dir) / "checkpoint.jsonl")
+        stats = run_extraction(docs, extract_document, checkpoint, **kwargs)
+        if stats["failed"]:
+            raise RuntimeError(
+                f"Extraction failed for {stats['failed']} documents."
+            )
+        return checkpoint.load_predictions()
+
+
+def doc_pmcid(doc):
+    if "pmcid" in doc:
+        return doc["pmcid"]
+    return doc["metadata"]["pmcid"]
+
+
+def publang_extractor(api_key, max_tokens, **kwargs):
+    """`extract_document` function calling publang for a single document.
+
+    `kwargs` are passed to `extract_gpt_demographics` (e.g.
+    `extraction_model_name`).
+    """
+    from publang.pipelines import extract_gpt_demographics
+
+    def extract_document(doc):
+        predictions = extract_gpt_demographics(
+            articles=[doc],
+            api_key=api_key,
+            max_tokens=max_tokens,
+            num_workers=1,
+            **kwargs,
+        )
+        if predictions is None or not len(predictions):
+            return []
+        return [
+            {key: _json_value(value) for key, value in row.items()}
+            for row in predictions.drop(
+                columns="pmcid", errors="ignore"
+            ).to_dict(orient="records")
+        ]
+
+    return extract_document
+
+
+def _json_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    return value
@@ -0,0 +1,294 @@
+"""Append-only extraction of demographics, resumable after a crash.
+
+The output JSONL file (demographics.jsonl) is accompanied by a manifest,
+also JSONL. Its first line records the extractor name and version; each
+following line records one committed batch: the pmcids and text hashes of
+the articles it contains and the size of the output file once the batch was
+appended.
+
+When the extraction runs again, only articles whose pmcid is not in the
+manifest, or whose text hash changed, are extracted; their records are
+appended (the last record of a pmcid is the one that counts, see
+`demographics_table.load_demographics`). A batch is committed by writing its
+manifest line after the records: on startup, anything written after the
+last committed batch (e.g. by a run that crashed) is truncated, so the
+extraction resumes from there. If there is no manifest or the extractor
+version changed, everything is extracted again. If the output file is
+shorter than the manifest says (e.g. it was deleted), the manifest is
+discarded and everything is extracted again too. Articles that are no
+longer in text.csv are removed from the output and the manifest at the end
+of the run.
+
+text.csv is read as raw strings (`read_text_chunks`), so that the hash of a
+row does not depend on the types pandas would infer for each chunk.
+"""
+import json
+import os
+import pathlib
+import tempfile
+
+import pandas as pd
+
+from scanning_horizon import SampleSizeExtractor, text_hash
+
+MANIFEST_FORMAT_VERSION = 2
+
+_SAMPLE_SIZE_EXTRACTOR = SampleSizeExtractor()
+
+
+def read_text_chunks(text_file, chunksize):
+    """Read text.csv in chunks of `chunksize` rows, all columns as strings.
+
+    Empty fields are read as empty strings rather than NaN.
+    """
+    return pd.read_csv(
+        text_file, chunksize=chunksize, dtype=str, keep_default_na=False
+    )
+
+
+def row_hashes(texts):
+    """Hash of each row of a text.csv chunk (all its columns).
+
+    `texts` must have been read with `read_text_chunks`.
+    """
+    return [text_hash("\x1f".join(row)) for row in texts.itertuples(False)]
+
+
+def scanning_horizon_version():
+    """Version of the scanning_horizon extractor run by `extract_batch`."""
+    return _SAMPLE_SIZE_EXTRACTOR.cache_id[1]
+
+
+def _manifest_header(extractor, version):
+    return {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "extractor": extractor,
+        "version": version,
+    }
+
+
+def has_manifest(manifest_file, extractor, version):
+    """Whether there is a manifest for this extractor and version."""
+    manifest_file = pathlib.Path(manifest_file)
+    if not manifest_file.is_file():
+        return False
+    with open(manifest_file, "rb") as manifest_f:
+        try:
+            header = json.loads(manifest_f.readline())
+        except ValueError:
+            return False
+    return header == _manifest_header(extractor, version)
+
+
+def write_manifest(manifest_file, output_file, extractor, version, articles):
+    """Manifest for an output file written in one go.
+
+    `articles` is a list of [pmcid, row hash], for all articles in
+    `output_file`.
+    """
+    batch = {
+        "size": pathlib.Path(output_file).stat().st_size,
+        "articles": [[str(pmcid), row_hash] for pmcid, row_hash in articles],
+    }
+    _write_atomically(
+        pathlib.Path(manifest_file),
+        (
+            f"{json.dumps(_manifest_header(extractor, version))}\n"
+            f"{json.dumps(batch)}\n"
+        ).encode(),
+    )
+
+
+class Manifest:
+    """Committed state of an output file; see the module docstring."""
+
+    def __init__(self, manifest_file, output_file, extractor, version):
+        self.manifest_file = pathlib.Path(manifest_file)
+        self.output_file = pathlib.Path(output_file)
+        self.header = _manifest_header(extractor, version)
+        self.hashes = {}
+        self.committed_size = 0
+        self._recover()
+
+    def _recover(self):
+        lines = []
+        if self.manifest_file.is_file():
+            with open(self.manifest_file, "rb") as manifest_f:
+                lines = manifest_f.read().split(b"\n")
+        valid_lines = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line that was being written when the previous run stopped
+                break
+            if not valid_lines:
+                if record != self.header:
+                    break
+            else:
+                self.hashes.update(record["articles"])
+                self.committed_size = record["size"]
+            valid_lines.append(line)
+        self.output_file.touch()
+        if self.output_file.stat().st_size < self.committed_size:
+            # the output lost committed records: start over
+            valid_lines = []
+        if not valid_lines:
+            valid_lines = [json.dumps(self.header).encode()]
+            self.hashes, self.committed_size = {}, 0
+        _write_atomically(
+            self.manifest_file, b"\n".join(valid_lines) + b"\n"
+        )
+        with open(self.output_file, "r+b") as output_f:
+            output_f.truncate(self.committed_size)
+
+    def keep_only(self, pmcids):
+        """Remove the records of articles not in `pmcids` (a set of str).
+
+        The output is rewritten, then the manifest, as a single batch. If we
+        stop in between, the output is shorter than the manifest says, so
+        everything is extracted again. Returns the number of removed
+        articles.
+        """
+        removed = self.hashes.keys() - pmcids
+        if not removed:
+            return 0
+        tmp_file = self.output_file.with_name(f"{self.output_file.name}.tmp")
+        with open(self.output_file, "rb") as output_f, open(
+            tmp_file, "wb"
+        ) as tmp_f:
+            for line in output_f:
+                if str(json.loads(line)["pmcid"]) not in removed:
+                    tmp_f.write(line)
+            tmp_f.flush()
+            os.fsync(tmp_f.fileno())
+            size = tmp_f.tell()
+        os.replace(tmp_file, self.output_file)
+        self.hashes = {
+            pmcid: row_hash
+            for pmcid, row_hash in self.hashes.items()
+            if pmcid not in removed
+        }
+        self.committed_size = size
+        batch = {
+            "size": size,
+            "articles": [list(article) for article in self.hashes.items()],
+        }
+        _write_atomically(
+            self.manifest_file,
+            f"{json.dumps(self.header)}\n{json.dumps(batch)}\n".encode(),
+        )
+        return len(removed)
+
+    def is_up_to_date(self, pmcid, row_hash):
+        return self.hashes.get(str(pmcid)) == row_hash
+
+    def append(self, records, pmcids, hashes):
+        """Append a batch of JSON records and commit it."""
+        with open(self.output_file, "ab") as output_f:
+            for record in records:
+                output_f.write(json.dumps(record).encode("utf-8") + b"\n")
+            output_f.flush()
+            os.fsync(output_f.fileno())
+            size = output_f.tell()
+        articles = [[str(pmcid), h] for pmcid, h in zip(pmcids, hashes)]
+        with open(self.manifest_file, "ab") as manifest_f:
+            manifest_f.write(
+                json.dumps({"size": size, "articles": articles}).encode()
+                + b"\n"
+            )
+            manifest_f.flush()
+            os.fsync(manifest_f.fileno())
+        self.hashes.update(articles)
+        self.committed_size = size
+
+
+def extract_incrementally(
+    text_file,
+    output_file,
+    manifest_file,
+    extract_from_dataset,
+    extractor,
+    version,
+    batch_size=1000,
+):
+    """Extract demographics for new or changed rows of a text.csv file.
+
+    `text_file` is read in chunks, and the rows to extract are grouped in
+    batches of `batch_size`. `extract_from_dataset(input_csv, output_jsonl)`
+    is applied to a temporary CSV file holding each batch; it must write one
+    record per row, in order. The records of articles that are no longer in
+    `text_file` are removed. Returns the number of extracted articles.
+    """
+    manifest = Manifest(manifest_file, output_file, extractor, version)
+    n_extracted = 0
+    input_pmcids = set()
+    pending, pending_hashes = [], []
+    for chunk in read_text_chunks(text_file, batch_size):
+        hashes = row_hashes(chunk)
+        input_pmcids.update(map(str, chunk["pmcid"]))
+        todo = [
+            not manifest.is_up_to_date(pmcid, row_hash)
+            for pmcid, row_hash in zip(chunk["pmcid"], hashes)
+        ]
+        pending.append(chunk[todo])
+        pending_hashes.extend(h for h, is_todo in zip(hashes, todo) if is_todo)
+        while len(pending_hashes) >= batch_size:
+            pending = [pd.concat(pending)]
+            batch = pending[0].iloc[:batch_size]
+            pending = [pending[0].iloc[batch_size:]]
+            _extract_and_commit(
+                batch,
+                pending_hashes[:batch_size],
+                manifest,
+                extract_from_dataset,
+            )
+            del pending_hashes[:batch_size]
+            n_extracted += len(batch)
+    if pending_hashes:
+        batch = pd.concat(pending)
+        _extract_and_commit(
+            batch, pending_hashes, manifest, extract_from_dataset
+        )
+        n_extracted += len(batch)
+    manifest.keep_only(input_pmcids)
+    return n_extracted
+
+
+def _extract_and_commit(batch, hashes, manifest, extract_from_dataset):
+    records = extract_batch(batch, extract_from_dataset)
+    manifest.append(records, batch["pmcid"].tolist(), hashes)
+
+
+def extract_batch(batch, extract_from_dataset):
+    """Run `extract_from_dataset` on rows of text.csv; return the records.
+
+    Records get the pmcid of their row if the extractor did not set it, and
+    the number of participants found in the abstract by scanning_horizon's
+    extractor, in "scanning_horizon".
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        batch_csv = pathlib.Path(tmp_dir) / "text.csv"
+        batch_jsonl = pathlib.Path(tmp_dir) / "demographics.jsonl"
+        batch.to_csv(batch_csv, index=False)
+        extract_from_dataset(batch_csv, batch_jsonl)
+        with open(batch_jsonl, encoding="utf-8") as batch_f:
+            records = [json.loads(line) for line in batch_f if line.strip()]
+    if len(records) != len(batch):
+        raise RuntimeError(
+            f"Extractor returned {len(records)} records for {len(batch)} "
+            "articles."
+        )
+    abstracts = batch["abstract"].fillna("").astype(str)
+    for record, pmcid, abstract in zip(records, batch["pmcid"], abstracts):
+        record.setdefault("pmcid", int(pmcid))
+        record["scanning_horizon"] = {
+            "count": _SAMPLE_SIZE_EXTRACTOR.n_participants(abstract)
+        }
+    return records
+
+
+def _write_atomically(file_path, data):
+    tmp_file = file_path.with_name(f"{file_path.name}.tmp")
+    tmp_file.write_bytes(data)
+    os.replace(tmp_file, file_path)
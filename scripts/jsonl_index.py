@@ -0,0 +1,94 @@
+"""Random access to documents in JSONL files, by pmcid.
+
+The index maps each pmcid to the file, byte offset and length of the line
+holding its document. It is stored in a JSON sidecar file and rebuilt only
+for the files whose size or modification time changed, so loading a few
+documents does not require decoding the whole corpus.
+"""
+import json
+import mmap
+import os
+import pathlib
+
+INDEX_FORMAT_VERSION = 1
+
+
+def load_index(jsonl_files, index_file):
+    """Return a dict pmcid -> (file path, byte offset, length)."""
+    index_file = pathlib.Path(index_file)
+    stored_files = {}
+    if index_file.is_file():
+        stored = json.loads(index_file.read_text("utf-8"))
+        if stored.get("version") == INDEX_FORMAT_VERSION:
+            stored_files = stored["files"]
+    files, changed = {}, False
+    for jsonl_file in jsonl_files:
+        file_key = str(pathlib.Path(jsonl_file).resolve())
+        signature = _file_signature(file_key)
+        file_index = stored_files.get(file_key)
+        if file_index is None or file_index["signature"] != signature:
+            file_index = {
+                "signature": signature,
+                "documents": _index_file(file_key),
+            }
+            changed = True
+        files[file_key] = file_index
+    if changed or files.keys() != stored_files.keys():
+        _write_atomically(
+            index_file, {"version": INDEX_FORMAT_VERSION, "files": files}
+        )
+    index = {}
+    for file_key, file_index in files.items():
+        for pmcid, offset, length in file_index["documents"]:
+            index[pmcid] = (file_key, offset, length)
+    return index
+
+
+def read_documents(index, pmcids):
+    """Yield the documents with the given pmcids, in file order.
+
+    pmcids that are not in the index are ignored.
+    """
+    locations = sorted(index[pmcid] for pmcid in set(pmcids) if pmcid in index)
+    current_file, mapped = None, None
+    try:
+        for file_key, offset, length in locations:
+            if file_key != current_file:
+                if mapped is not None:
+                    mapped.close()
+                with open(file_key, "rb") as file_obj:
+                    mapped = mmap.mmap(
+                        file_obj.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+                current_file = file_key
+            yield json.loads(mapped[offset : offset + length])
+    finally:
+        if mapped is not None:
+            mapped.close()
+
+
+def _file_signature(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _get_pmcid(doc):
+    return doc.get("metadata", doc.get("meta", {})).get("pmcid")
+
+
+def _index_file(file_path):
+    documents = []
+    offset = 0
+    with open(file_path, "rb") as file_obj:
+        for line in file_obj:
+            if line.strip():
+                pmcid = _get_pmcid(json.loads(line))
+                documents.append([pmcid, offset, len(line)])
+            offset += len(line)
+    return documents
+
+
+def _write_atomically(file_path, data):
+    tmp_file = file_path.with_name(f"{file_path.name}.tmp")
+    tmp_file.write_text(json.dumps(data), "utf-8")
+    os.replace(tmp_file, file_path)
@@ -0,0 +1,365 @@
+#! /usr/bin/env python3
+"""Persistent cache of OpenAI API responses, served by a local proxy.
+
+publang sends its requests with the openai client, so instead of patching
+it, the requests are routed (with OPENAI_BASE_URL) through a local HTTP
+proxy. The proxy answers from the cache when it can and otherwise forwards
+the request to the real API and stores the response. In replay-only mode,
+it never forwards anything: a request missing from the cache fails (HTTP
+404) and is counted in `stats["misses"]`.
+
+Responses are stored in a `scanning_horizon.ExtractionCache`
+(data/cache/llm_cache.sqlite) keyed by:
+
+- the endpoint and model name (the cache's "extractor"),
+- a hash of the prompt template and generation parameters, i.e. everything
+  in the request except the model and the last user message (the cache's
+  "version"),
+- a hash of the last user message, which holds the chunk of text (for
+  embeddings, of the input).
+
+Entries are evicted when the cache grows above a size (least recently used
+first), or when they have not been used for some time.
+
+Usage:
+    python scripts/llm_cache.py serve --port 8001 [--replay_only]
+    python scripts/llm_cache.py stats
+    python scripts/llm_cache.py evict --max_size_mb 500 --max_age_days 90
+"""
+import argparse
+import collections
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+from scanning_horizon import MISSING, ExtractionCache, text_hash
+
+DEFAULT_UPSTREAM_URL = "https://api.openai.com/v1"
+
+# request headers that concern the connection to the proxy rather than the
+# request itself
+_HOP_BY_HOP_HEADERS = {
+    "host",
+    "content-length",
+    "connection",
+    "accept-encoding",
+    "keep-alive",
+    "transfer-encoding",
+}
+# response headers passed on to the client when forwarding an error
+_FORWARDED_RESPONSE_HEADERS = {
+    "retry-after",
+    "retry-after-ms",
+    "x-ratelimit-limit-requests",
+    "x-ratelimit-limit-tokens",
+    "x-ratelimit-remaining-requests",
+    "x-ratelimit-remaining-tokens",
+    "x-ratelimit-reset-requests",
+    "x-ratelimit-reset-tokens",
+}
+
+
+def request_key(endpoint, request):
+    """(extractor, version, key) of a request in the cache, or None.
+
+    Streamed responses are not cached.
+    """
+    if request.get("stream"):
+        return None
+    params = {
+        name: value
+        for name, value in request.items()
+        if name not in ("model", "messages", "input", "user")
+    }
+    if endpoint == "chat/completions":
+        messages = list(request.get("messages", []))
+        user_positions = [
+            i
+            for i, message in enumerate(messages)
+            if message["role"] == "user"
+        ]
+        chunk = None
+        if user_positions:
+            chunk = messages.pop(user_positions[-1])["content"]
+        template = {"messages": messages, "params": params}
+    elif endpoint == "embeddings":
+        chunk = request.get("input")
+        template = {"params": params}
+    else:
+        return None
+    return (
+        f"openai/{endpoint}:{request.get('model')}",
+        text_hash(json.dumps(template, sort_keys=True)),
+        text_hash(json.dumps(chunk)),
+    )
+
+
+class CachingProxy:
+    """OpenAI API proxy caching responses, running in a background thread.
+
+    Parameters
+    ----------
+    cache_file : str or pathlib.Path
+        SQLite database holding the responses.
+    upstream_url : str
+        API to which cache misses are forwarded.
+    replay_only : bool
+        Never forward requests: cache misses fail.
+    port : int
+        0 picks a free port; see the `url` attribute.
+    max_size_bytes : int
+        Size cap of the cache.
+    max_age_seconds : float or None
+        If not None, entries unused for longer are deleted on startup.
+    """
+
+    def __init__(
+        self,
+        cache_file,
+        upstream_url=DEFAULT_UPSTREAM_URL,
+        replay_only=False,
+        port=0,
+        max_size_bytes=2 * 1024**3,
+        max_age_seconds=None,
+    ):
+        self.upstream_url = upstream_url.rstrip("/")
+        self.replay_only = replay_only
+        self.cache = ExtractionCache(cache_file, max_size_bytes)
+        if max_age_seconds is not None:
+            self.cache.evict_unused(max_age_seconds)
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            self.cache.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def serve_forever(self):
+        try:
+            self._server.serve_forever()
+        finally:
+            with self._lock:
+                self.cache.close()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, key):
+        with self._lock:
+            return self.cache.get(key[0], key[1], key=key[2])
+
+    def put(self, key, response):
+        with self._lock:
+            self.cache.put(key[0], key[1], response, key=key[2])
+            # responses are expensive: make them durable right away
+            self.cache.commit()
+
+    def forward(self, method, path, headers, body):
+        """Send a request to the upstream API; return status, headers, body."""
+        request = urllib.request.Request(
+            f"{self.upstream_url}{path}",
+            data=body,
+            method=method,
+            headers={
+                name: value
+                for name, value in headers.items()
+                if name.lower() not in _HOP_BY_HOP_HEADERS
+            },
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers, error.read()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _endpoint(self):
+        path = self.path.split("?")[0].strip("/")
+        return path[len("v1/") :] if path.startswith("v1/") else path
+
+    def do_GET(self):
+        proxy = self.server.proxy
+        if self._endpoint() == "stats":
+            with proxy._lock:
+                stats = dict(proxy.stats)
+            self._send(200, json.dumps(stats).encode())
+            return
+        if proxy.replay_only:
+            self._send_miss()
+            return
+        status, headers, body = proxy.forward(
+            "GET", self._upstream_path(), self.headers, None
+        )
+        self._send(status, body, headers)
+
+    def do_POST(self):
+        proxy = self.server.proxy
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        try:
+            key = request_key(self._endpoint(), json.loads(body or b"{}"))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            key = None
+        if key is not None:
+            response = proxy.get(key)
+            if response is not MISSING:
+                proxy._count("hits")
+                self._send(200, json.dumps(response).encode())
+                return
+        proxy._count("misses")
+        if proxy.replay_only:
+            self._send_miss()
+            return
+        status, headers, response_body = proxy.forward(
+            "POST", self._upstream_path(), self.headers, body
+        )
+        proxy._count("forwarded")
+        if status == 200 and key is not None:
+            proxy.put(key, json.loads(response_body))
+        self._send(status, response_body, headers)
+
+    def _upstream_path(self):
+        path = self.path
+        return path[len("/v1") :] if path.startswith("/v1/") else path
+
+    def _send_miss(self):
+        error = {
+            "message": "Request not in the cache (replay-only mode).",
+            "type": "cache_miss",
+            "code": "cache_miss",
+        }
+        self._send(404, json.dumps({"error": error}).encode())
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            if name.lower() in _FORWARDED_RESPONSE_HEADERS:
+                self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@contextlib.contextmanager
+def cached_openai_api(cache_file, replay_only=False, **kwargs):
+    """Route the openai client through a `CachingProxy` within this block.
+
+    Requests are forwarded to the API set in OPENAI_BASE_URL, if any. Yields
+    the proxy, whose `stats` count cache hits and misses.
+    """
+    base_url = os.environ.get("OPENAI_BASE_URL")
+    with CachingProxy(
+        cache_file,
+        base_url or DEFAULT_UPSTREAM_URL,
+        replay_only=replay_only,
+        **kwargs,
+    ) as proxy:
+        os.environ["OPENAI_BASE_URL"] = proxy.url
+        try:
+            yield proxy
+        finally:
+            if base_url is None:
+                del os.environ["OPENAI_BASE_URL"]
+            else:
+                os.environ["OPENAI_BASE_URL"] = base_url
+
+
+if __name__ == "__main__":
+    import utils
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cache_file", type=str, default=str(utils.get_llm_cache_file())
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run the caching proxy."
+    )
+    serve_parser.add_argument("--port", type=int, default=8001)
+    serve_parser.add_argument(
+        "--upstream",
+        help="API to which cache misses are forwarded.",
+        type=str,
+        default=os.environ.get("OPENAI_BASE_URL") or DEFAULT_UPSTREAM_URL,
+    )
+    serve_parser.add_argument(
+        "--replay_only",
+        help="Never call the API; fail on cache misses.",
+        action="store_true",
+    )
+    subparsers.add_parser("stats", help="Show the entries of each model.")
+    evict_parser = subparsers.add_parser(
+        "evict", help="Delete old entries, or entries above a size."
+    )
+    evict_parser.add_argument(
+        "--max_size_mb",
+        help="Delete least recently used entries above this size, in MB.",
+        type=float,
+        default=None,
+    )
+    evict_parser.add_argument(
+        "--max_age_days",
+        help="Delete entries unused for this many days.",
+        type=float,
+        default=None,
+    )
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        proxy = CachingProxy(
+            args.cache_file,
+            args.upstream,
+            replay_only=args.replay_only,
+            port=args.port,
+        )
+        print(f"Serving on {proxy.url}")
+        try:
+            proxy.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        with ExtractionCache(args.cache_file) as cache:
+            if args.command == "stats":
+                print(json.dumps(cache.stats(), indent=2))
+                print(f"Total size: {cache.size_bytes() / 1e6:.1f} MB")
+            else:
+                n_deleted = 0
+                if args.max_age_days is not None:
+                    n_deleted += cache.evict_unused(
+                        args.max_age_days * 24 * 3600
+                    )
+                if args.max_size_mb is not None:
+                    n_deleted += cache.evict(int(args.max_size_mb * 1e6))
+                print(f"{n_deleted} entries deleted.")
@@ -0,0 +1,324 @@
+#! /usr/bin/env python3
+"""Chunk and embed articles at several chunk sizes, sharing the work.
+
+Articles are tokenized once, and split into base chunks of `base_size`
+tokens, whose character offsets are saved (base_chunks_<base_size>.npz).
+Chunks of n × `base_size` tokens are made by merging n adjacent base chunks
+of an article, which only needs the offsets, so adding a chunk size does not
+tokenize the corpus again.
+
+Chunk embeddings are cached by hash of the chunk text (`EmbeddingCache`), so
+only chunks never seen before are sent to the API. For each chunk size, the
+chunks and their embeddings are written to an embedding store (see
+embedding_store.py), e.g. for `chunk_retrieval.py`.
+
+Example:
+    python scripts/multi_resolution_chunks.py data/fmri_documents.jsonl \\
+        --sizes 1000 2000 4000 --output_dir data/outputs/gpt/chunks
+"""
+import argparse
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+import chunk_retrieval
+import embedding_store
+import gpt_extraction
+from scanning_horizon import text_hash
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+# chunks copied from the cache to a store at a time
+_STORE_BATCH_SIZE = 10000
+
+
+def tiktoken_token_starts(encoding_name="cl100k_base"):
+    """Function returning the character offset of each token of a text."""
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    def token_starts(text):
+        tokens = encoding.encode(text, disallowed_special=())
+        return np.asarray(
+            encoding.decode_with_offsets(tokens)[1], dtype="int64"
+        )
+
+    return token_starts
+
+
+def base_chunks(docs, token_starts, base_size=500):
+    """Character offsets of the base chunks of all documents.
+
+    Returns a dict of arrays with one entry per base chunk: "pmcid",
+    "start_char" and "end_char". The chunks of a document are consecutive.
+    """
+    pmcids, starts, ends = [], [], []
+    for doc in docs:
+        text = doc["text"]
+        chunk_starts = token_starts(text)[::base_size]
+        if not len(chunk_starts):
+            continue
+        pmcids.append(
+            np.full(len(chunk_starts), gpt_extraction.doc_pmcid(doc))
+        )
+        starts.append(chunk_starts)
+        ends.append(np.append(chunk_starts[1:], len(text)))
+    if not pmcids:
+        pmcids = starts = ends = [np.zeros(0, dtype="int64")]
+    return {
+        "pmcid": np.concatenate(pmcids).astype("int64"),
+        "start_char": np.concatenate(starts).astype("int64"),
+        "end_char": np.concatenate(ends).astype("int64"),
+    }
+
+
+def merge_chunks(base, n_merged):
+    """Chunks made of `n_merged` adjacent base chunks of the same document.
+
+    Returns a DataFrame with pmcid, chunk_index, start_char and end_char.
+    """
+    offsets = chunk_retrieval.document_offsets(base["pmcid"])
+    lengths = np.diff(offsets)
+    document = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(document)) - offsets[document]
+    first = np.flatnonzero(position % n_merged == 0)
+    last = np.minimum(first + n_merged, offsets[document[first] + 1]) - 1
+    return pd.DataFrame(
+        {
+            "pmcid": base["pmcid"][first],
+            "chunk_index": position[first] // n_merged,
+            "start_char": base["start_char"][first],
+            "end_char": base["end_char"][last],
+        }
+    )
+
+
+class EmbeddingCache:
+    """Embeddings of chunks of text, keyed by hash of the text.
+
+    Stored in `cache_dir` as a float32 matrix (embeddings.f32) and the hash
+    of each row (hashes.txt). Rows are appended, and committed by writing
+    their hashes; rows without a hash, written by a run that stopped, are
+    truncated on opening.
+    """
+
+    def __init__(self, cache_dir, dim):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._hashes_file = self.cache_dir / "hashes.txt"
+        self._embeddings_file = self.cache_dir / "embeddings.f32"
+        self.rows = {}
+        valid_size = 0
+        if self._hashes_file.is_file():
+            with open(self._hashes_file, "rb") as hashes_f:
+                for line in hashes_f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self.rows[line.decode().strip()] = len(self.rows)
+                    valid_size += len(line)
+        self._hashes_file.touch()
+        self._embeddings_file.touch()
+        with open(self._hashes_file, "r+b") as hashes_f:
+            hashes_f.truncate(valid_size)
+        with open(self._embeddings_file, "r+b") as embeddings_f:
+            if embeddings_f.seek(0, os.SEEK_END) < len(self.rows) * dim * 4:
+                raise RuntimeError(
+                    f"{self._embeddings_file} is shorter than expected."
+                )
+            embeddings_f.truncate(len(self.rows) * dim * 4)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, keys):
+        """Embeddings for `keys`, which must all be in the cache."""
+        if not len(self.rows):
+            return np.empty((0, self.dim), dtype="float32")
+        embeddings = np.memmap(
+            self._embeddings_file,
+            dtype="<f4",
+            mode="r",
+            shape=(len(self.rows), self.dim),
+        )
+        return np.asarray(embeddings[[self.rows[key] for key in keys]])
+
+    def add(self, keys, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+        if embeddings.shape != (len(keys), self.dim):
+            raise ValueError(
+                f"Expected embeddings of shape {(len(keys), self.dim)}, "
+                f"got {embeddings.shape}."
+            )
+        with open(self._embeddings_file, "ab") as embeddings_f:
+            embeddings_f.write(embeddings.tobytes())
+            embeddings_f.flush()
+            os.fsync(embeddings_f.fileno())
+        with open(self._hashes_file, "a", encoding="utf-8") as hashes_f:
+            for key in keys:
+                hashes_f.write(f"{key}\n")
+            hashes_f.flush()
+            os.fsync(hashes_f.fileno())
+        for key in keys:
+            self.rows[key] = len(self.rows)
+
+
+def _iter_chunk_texts(docs, chunks):
+    """Text of each chunk, in order; `docs` are in the order of `chunks`."""
+    offsets = chunk_retrieval.document_offsets(chunks["pmcid"].to_numpy())
+    starts = chunks["start_char"].to_numpy()
+    ends = chunks["end_char"].to_numpy()
+    docs = iter(docs)
+    for i in range(len(offsets) - 1):
+        pmcid = chunks["pmcid"].iat[offsets[i]]
+        doc = next(docs)
+        while gpt_extraction.doc_pmcid(doc) != pmcid:
+            doc = next(docs)
+        for row in range(offsets[i], offsets[i + 1]):
+            yield doc["text"][starts[row] : ends[row]]
+
+
+def embed_chunks(docs, chunks, cache, embed_batch, batch_size=100):
+    """Add missing chunks to the cache; return the cache keys of `chunks`.
+
+    `embed_batch(texts)` returns an array of shape (len(texts), dim); it is
+    only called for texts that are not in the cache.
+    """
+    keys, missing_keys, missing_texts = [], [], []
+
+    def flush():
+        if missing_texts:
+            cache.add(missing_keys, embed_batch(missing_texts))
+            missing_keys.clear()
+            missing_texts.clear()
+
+    pending = set()
+    for text in _iter_chunk_texts(docs, chunks):
+        key = text_hash(text)
+        keys.append(key)
+        if key not in cache and key not in pending:
+            pending.add(key)
+            missing_keys.append(key)
+            missing_texts.append(text)
+            if len(missing_texts) >= batch_size:
+                flush()
+    flush()
+    return keys
+
+
+def openai_embed_batch(model=DEFAULT_EMBEDDING_MODEL):
+    from openai import OpenAI
+
+    client = OpenAI()
+
+    def embed_batch(texts):
+        response = client.embeddings.create(input=texts, model=model)
+        return np.asarray(
+            [item.embedding for item in response.data], dtype="float32"
+        )
+
+    return embed_batch
+
+
+def load_base_chunks(docs_file, base_chunks_file, token_starts, base_size):
+    """Base chunks, recomputed if missing or older than `docs_file`."""
+    base_chunks_file = pathlib.Path(base_chunks_file)
+    if (
+        base_chunks_file.is_file()
+        and base_chunks_file.stat().st_mtime
+        >= pathlib.Path(docs_file).stat().st_mtime
+    ):
+        return dict(np.load(base_chunks_file))
+    base = base_chunks(
+        gpt_extraction.iter_documents(docs_file), token_starts, base_size
+    )
+    tmp_file = base_chunks_file.with_name(f"{base_chunks_file.name}.tmp.npz")
+    np.savez(tmp_file, **base)
+    os.replace(tmp_file, base_chunks_file)
+    return base
+
+
+def build_chunk_stores(
+    docs_file,
+    output_dir,
+    sizes,
+    embed_batch,
+    dim,
+    token_starts,
+    base_size=500,
+    model=DEFAULT_EMBEDDING_MODEL,
+):
+    """Write an embedding store of the chunks of each size in `sizes`.
+
+    Sizes must be multiples of `base_size`. Returns the store directories.
+    """
+    for size in sizes:
+        if size % base_size:
+            raise ValueError(
+                f"Chunk size {size} is not a multiple of {base_size}."
+            )
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    base = load_base_chunks(
+        docs_file,
+        output_dir / f"base_chunks_{base_size}.npz",
+        token_starts,
+        base_size,
+    )
+    cache = EmbeddingCache(output_dir / f"embedding_cache_{model}", dim)
+    store_dirs = []
+    for size in sizes:
+        chunks = merge_chunks(base, size // base_size)
+        keys = embed_chunks(
+            gpt_extraction.iter_documents(docs_file),
+            chunks,
+            cache,
+            embed_batch,
+        )
+        store_dir = output_dir / f"chunks_tokens-{size}.embeddings"
+        with embedding_store.EmbeddingStoreWriter(store_dir) as writer:
+            for start in range(0, len(chunks), _STORE_BATCH_SIZE):
+                stop = start + _STORE_BATCH_SIZE
+                writer.append(
+                    chunks.iloc[start:stop], cache.get(keys[start:stop])
+                )
+        print(f"{len(chunks)} chunks of {size} tokens written to {store_dir}")
+        store_dirs.append(store_dir)
+    return store_dirs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "docs_file",
+        help="JSONL file of documents with 'pmcid' and 'text'.",
+        type=str,
+    )
+    parser.add_argument(
+        "--sizes",
+        help="Chunk sizes, in tokens.",
+        nargs="+",
+        type=int,
+        default=[2000, 4000],
+    )
+    parser.add_argument("--base_size", type=int, default=500)
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--model", type=str, default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    build_chunk_stores(
+        args.docs_file,
+        args.output_dir,
+        args.sizes,
+        openai_embed_batch(args.model),
+        args.dim,
+        tiktoken_token_starts(),
+        args.base_size,
+        args.model,
+    )
@@ -0,0 +1,381 @@
+#! /usr/bin/env python3
+"""Local stand-in for the OpenAI API, to test the GPT pipelines offline.
+
+Serves /v1/chat/completions, /v1/embeddings and /v1/models with
+deterministic responses: embeddings are derived from a hash of the input,
+and when a chat request offers a function (or tool), the stub calls it with
+the sample sizes found in the prompt ("<n> participants", "n = <n>"). Latency
+and rate-limit errors (HTTP 429) can be injected. /stats returns request
+counts, and the largest number of requests answered at once
+("max_in_flight").
+
+Point the openai client (and thus publang) at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+Example:
+    python scripts/openai_stub_server.py --port 8000 --latency 0.5 \\
+        --max_requests_per_minute 120
+"""
+import argparse
+import collections
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+
+_SAMPLE_SIZE_PATTERN = re.compile(
+    r"\b(\d+)\s+(?:participants|subjects|patients|volunteers)\b"
+    r"|\bn\s*=\s*(\d+)",
+    re.IGNORECASE,
+)
+
+
+class StubServer:
+    """OpenAI-compatible stub server, running in a background thread.
+
+    Parameters
+    ----------
+    port : int
+        0 picks a free port; see the `url` attribute.
+    latency : float
+        Seconds waited before answering each request.
+    latency_jitter : float
+        Random extra latency, uniform between 0 and this many seconds.
+    error_rate : float
+        Fraction of requests answered with a 429 error.
+    max_requests_per_minute : int or None
+        Requests beyond this rate (over a sliding minute) get a 429 error.
+    max_concurrent_requests : int or None
+        Requests arriving while this many are being answered get a 429
+        error.
+    retry_after : float
+        Value of the Retry-After header of 429 errors, in seconds.
+    embedding_dim : int
+        Length of the returned embeddings.
+    seed : int
+        Seed of the random latency and errors.
+    """
+
+    def __init__(
+        self,
+        port=0,
+        latency=0.0,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        max_requests_per_minute=None,
+        max_concurrent_requests=None,
+        retry_after=1.0,
+        embedding_dim=1536,
+        seed=0,
+    ):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_concurrent_requests = max_concurrent_requests
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.embedding_dim = embedding_dim
+        self.stats = collections.Counter()
+        self._random = random.Random(seed)
+        self._recent_requests = collections.deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self.url = f"http://127.0.0.1:{self._server.server_port}/v1"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def _admit(self):
+        """Latency to wait, or None if the request must be rejected."""
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            recent = self._recent_requests
+            while recent and recent[0] < now - 60:
+                recent.popleft()
+            rejected = (
+                self._random.random() < self.error_rate
+                or (
+                    self.max_requests_per_minute is not None
+                    and len(recent) >= self.max_requests_per_minute
+                )
+                or (
+                    self.max_concurrent_requests is not None
+                    and self.in_flight >= self.max_concurrent_requests
+                )
+            )
+            if rejected:
+                self.stats["rate_limited"] += 1
+                return None
+            self._recent_requests.append(now)
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(
+                self.stats["max_in_flight"], self.in_flight
+            )
+            return self.latency + self._random.uniform(0, self.latency_jitter)
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def chat_completion(self, request):
+        self._count("chat_completions")
+        prompt = "\n".join(
+            str(message.get("content") or "")
+            for message in request.get("messages", [])
+        )
+        message = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        function = None
+        if request.get("tools"):
+            function = request["tools"][0]["function"]["name"]
+        elif request.get("functions"):
+            function = request["functions"][0]["name"]
+        arguments = json.dumps({"groups": _find_groups(prompt)})
+        if function is None:
+            message["content"] = arguments
+        elif request.get("tools"):
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{_digest(prompt)[:24]}",
+                    "type": "function",
+                    "function": {"name": function, "arguments": arguments},
+                }
+            ]
+            finish_reason = "tool_calls"
+        else:
+            message["function_call"] = {
+                "name": function,
+                "arguments": arguments,
+            }
+            finish_reason = "function_call"
+        prompt_tokens = _n_tokens(prompt)
+        completion_tokens = _n_tokens(arguments)
+        return {
+            "id": f"chatcmpl-{_digest(prompt)[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embeddings(self, request):
+        self._count("embeddings")
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = [
+            {
+                "object": "embedding",
+                "index": i,
+                "embedding": _embedding(str(text), self.embedding_dim),
+            }
+            for i, text in enumerate(inputs)
+        ]
+        n_tokens = sum(_n_tokens(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        if self.path.rstrip("/").endswith("/models"):
+            models = [{"id": "stub", "object": "model"}]
+            self._send(200, {"object": "list", "data": models})
+        elif self.path.rstrip("/").endswith("/stats"):
+            with stub._lock:
+                stats = dict(stub.stats)
+            self._send(200, stats)
+        else:
+            self._send(404, _error("Not found", "invalid_request_error"))
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        latency = stub._admit()
+        if latency is None:
+            self._send(
+                429,
+                _error("Rate limit reached (stub).", "rate_limit_exceeded"),
+                {"Retry-After": f"{stub.retry_after:g}"},
+            )
+            return
+        try:
+            time.sleep(latency)
+            path = self.path.rstrip("/")
+            if path.endswith("/chat/completions"):
+                response = (200, stub.chat_completion(request))
+            elif path.endswith("/embeddings"):
+                response = (200, stub.embeddings(request))
+            else:
+                response = (
+                    404,
+                    _error("Not found", "invalid_request_error"),
+                )
+        finally:
+            stub._done()
+        self._send(*response)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _error(message, code):
+    return {"error": {"message": message, "type": code, "code": code}}
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _n_tokens(text):
+    # rough approximation of the OpenAI tokenizers: ~4 characters per token
+    return max(1, len(text) // 4)
+
+
+def _embedding(text, dim):
+    rng = random.Random(_digest(text))
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+def _find_groups(text):
+    groups = []
+    for match in _SAMPLE_SIZE_PATTERN.finditer(text):
+        count = int(match.group(1) or match.group(2))
+        groups.append(
+            {
+                "count": count,
+                "diagnosis": None,
+                "group_name": "healthy",
+                "subgroup_name": None,
+                "male count": None,
+                "female count": None,
+                "age mean": None,
+                "age minimum": None,
+                "age maximum": None,
+                "age median": None,
+            }
+        )
+        if len(groups) == 3:
+            break
+    return groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency",
+        help="Seconds waited before answering each request.",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--latency_jitter",
+        help="Maximum random extra latency, in seconds.",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--error_rate",
+        help="Fraction of requests answered with a 429 error.",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--max_requests_per_minute",
+        help="Requests beyond this rate get a 429 error.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--max_concurrent_requests",
+        help="Requests beyond this many in flight get a 429 error.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--retry_after",
+        help="Retry-After header of 429 errors, in seconds.",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument("--embedding_dim", type=int, default=1536)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubServer(
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        max_requests_per_minute=args.max_requests_per_minute,
+        max_concurrent_requests=args.max_concurrent_requests,
+        retry_after=args.retry_after,
+        embedding_dim=args.embedding_dim,
+        seed=args.seed,
+    )
+    print(f"Serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
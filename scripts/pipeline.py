@@ -0,0 +1,436 @@
+#! /usr/bin/env python3
+"""Build the outputs and figures, running only the stages that changed.
+
+Each stage runs one script and declares the files it reads and writes. A
+stage depends on the stages that write the files it reads; the other inputs
+are external data (pubget dataset, labelbuddy documents and annotations).
+Before running a stage, its inputs are hashed:
+
+- the content of the files and directories it reads,
+- its code: the script and the local modules it imports (found by parsing
+  them) and the scanning_horizon sources,
+- the versions of the packages that can change its results (extractors).
+
+The hashes are stored in data/outputs/pipeline_state.json when the stage
+succeeds, and it is skipped the next time if none of them changed and its
+outputs exist. Content hashes of files are reused as long as their size and
+modification time do not change. Stages that do not depend on each other
+run concurrently.
+
+Example:
+    python scripts/pipeline.py --dry-run
+    python scripts/pipeline.py -j 4 --explain plot_n_participants
+"""
+import argparse
+import ast
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import hashlib
+import importlib.metadata
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import threading
+from typing import NamedTuple, Tuple
+
+import utils
+
+SCRIPTS_DIR = pathlib.Path(__file__).resolve().parent
+REPO_ROOT = SCRIPTS_DIR.parent
+STATE_FORMAT_VERSION = 1
+
+
+class Stage(NamedTuple):
+    script: str
+    inputs: Tuple[pathlib.Path, ...]
+    outputs: Tuple[pathlib.Path, ...]
+    packages: Tuple[str, ...] = ()
+
+    @property
+    def name(self):
+        return pathlib.Path(self.script).stem
+
+
+def get_stages():
+    from labelrepo import repo
+
+    outputs_dir = utils.get_outputs_dir()
+    figures_dir = utils.get_figures_dir()
+    pubget_dir = utils.get_pubget_data_dir()
+    labelbuddy_dir = utils.get_labelbuddy_data_dir()
+    annotation_project_dir = (
+        repo.repo_root() / "projects" / "participant_demographics"
+    )
+    demographics = utils.get_demographics_file()
+    store = utils.get_demographics_store_dir()
+    annotated_docs = outputs_dir / "automatically_annotated_docs.json"
+    n_participants = outputs_dir / "n_participants.csv"
+    return [
+        Stage(
+            "extract_demographics.py",
+            (pubget_dir / "text.csv",),
+            (demographics, utils.get_demographics_manifest_file()),
+            ("pubextract",),
+        ),
+        Stage(
+            "build_demographics_store.py",
+            (demographics, pubget_dir / "metadata.csv"),
+            (store,),
+            ("pyarrow",),
+        ),
+        Stage(
+            "annotate.py",
+            (labelbuddy_dir,),
+            (annotated_docs,),
+            ("pubextract",),
+        ),
+        Stage(
+            "extract_n_for_labelled_papers.py",
+            (
+                annotation_project_dir,
+                outputs_dir
+                / "eval_participant_demographics_gpt_tokens-2000.csv",
+            ),
+            (n_participants,),
+            ("pubextract", "labelrepo"),
+        ),
+        Stage(
+            "plot_n_participants.py",
+            (store, utils.get_repo_data_dir() / "annotations"),
+            (figures_dir / "n_participants.pdf",),
+        ),
+        Stage(
+            "plot_ages.py",
+            (demographics,),
+            (
+                figures_dir / "ages_distrib_detailed.pdf",
+                figures_dir / "ages_distrib.pdf",
+            ),
+        ),
+        Stage(
+            "n_participants_abstract_vs_body.py",
+            (labelbuddy_dir, annotated_docs),
+            (figures_dir / "n_participants_abstract_vs_body.pdf",),
+            ("pubextract",),
+        ),
+        Stage(
+            "plot_n_participants_scatter.py",
+            (
+                n_participants,
+                utils.get_repo_data_dir() / "training_pmcids.json",
+            ),
+            (
+                figures_dir / "extraction_scatterplot.pdf",
+                outputs_dir / "extraction_scores.json",
+            ),
+        ),
+        Stage(
+            "evaluate_demographics_gpt.py",
+            (
+                outputs_dir / "evaluation_labels.csv",
+                *sorted((outputs_dir / "gpt").glob("eval_*_clean.csv")),
+            ),
+            (
+                outputs_dir / "gpt" / "evaluation_metrics.csv",
+                outputs_dir / "gpt" / "evaluation",
+            ),
+        ),
+    ]
+
+
+class FileHasher:
+    """Content hashes of files and directories, reusing known hashes.
+
+    `known_hashes` maps a file path to [size, mtime_ns, sha256]; a file is
+    read again only if its size or modification time changed.
+    """
+
+    def __init__(self, known_hashes=None):
+        self.known_hashes = dict(known_hashes or {})
+        self._lock = threading.Lock()
+
+    def hash_path(self, path):
+        path = pathlib.Path(path)
+        if path.is_file():
+            return self._hash_file(path)
+        if path.is_dir():
+            dir_hash = hashlib.sha256()
+            for file_path in sorted(path.rglob("*")):
+                if file_path.is_file() and "__pycache__" not in file_path.parts:
+                    relative = file_path.relative_to(path).as_posix()
+                    file_hash = self._hash_file(file_path)
+                    dir_hash.update(f"{relative}\0{file_hash}\n".encode())
+            return dir_hash.hexdigest()
+        return "missing"
+
+    def _hash_file(self, path):
+        key = str(path.resolve())
+        stat = path.stat()
+        with self._lock:
+            known = self.known_hashes.get(key)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        sha = utils.file_sha256(path)
+        with self._lock:
+            self.known_hashes[key] = [stat.st_size, stat.st_mtime_ns, sha]
+        return sha
+
+
+def local_modules(script):
+    """The script and the modules of the scripts directory it imports."""
+    found, to_visit = set(), [SCRIPTS_DIR / script]
+    while to_visit:
+        module_path = to_visit.pop()
+        if module_path in found:
+            continue
+        found.add(module_path)
+        tree = ast.parse(module_path.read_text("utf-8"))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidate = SCRIPTS_DIR / f"{name.split('.')[0]}.py"
+                if candidate.is_file():
+                    to_visit.append(candidate)
+    return sorted(found)
+
+
+def stage_inputs(stage, hasher):
+    """Dict of input description -> hash for a stage."""
+    inputs = {}
+    for path in stage.inputs:
+        inputs[f"file {_display_path(path)}"] = hasher.hash_path(path)
+    for module_path in local_modules(stage.script):
+        inputs[f"code {_display_path(module_path)}"] = hasher.hash_path(
+            module_path
+        )
+    scanning_horizon_src = REPO_ROOT / "scanning_horizon" / "src"
+    inputs[f"code {_display_path(scanning_horizon_src)}"] = hasher.hash_path(
+        scanning_horizon_src
+    )
+    for package in stage.packages:
+        try:
+            version = utils.get_package_version(package)
+        except importlib.metadata.PackageNotFoundError:
+            version = "not installed"
+        inputs[f"package {package}"] = version
+    return inputs
+
+
+def rebuild_reasons(stage, inputs, stored_inputs):
+    """Why the stage must run; an empty list if it is up to date."""
+    reasons = [
+        f"output missing: {_display_path(path)}"
+        for path in stage.outputs
+        if not path.exists()
+    ]
+    if stored_inputs is None:
+        return reasons + ["never built"]
+    for key, value in inputs.items():
+        if key not in stored_inputs:
+            reasons.append(f"new input: {key}")
+        elif stored_inputs[key] != value:
+            if key.startswith("package"):
+                reasons.append(
+                    f"changed: {key} {stored_inputs[key]} -> {value}"
+                )
+            else:
+                reasons.append(f"changed: {key}")
+    reasons.extend(
+        f"removed input: {key}" for key in stored_inputs if key not in inputs
+    )
+    return reasons
+
+
+def _display_path(path):
+    path = pathlib.Path(path).resolve()
+    try:
+        return path.relative_to(REPO_ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+
+class Pipeline:
+    def __init__(self, stages, state_file, n_jobs=1, explain=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_file = pathlib.Path(state_file)
+        self.n_jobs = n_jobs
+        self.explain = explain
+        self.state = {"version": STATE_FORMAT_VERSION, "stages": {}}
+        if self.state_file.is_file():
+            state = json.loads(self.state_file.read_text("utf-8"))
+            if state.get("version") == STATE_FORMAT_VERSION:
+                self.state = state
+        self.hasher = FileHasher(self.state.get("file_hashes"))
+        self._state_lock = threading.Lock()
+        producers = {
+            path: stage.name for stage in stages for path in stage.outputs
+        }
+        self.dependencies = {
+            stage.name: sorted(
+                {producers[p] for p in stage.inputs if p in producers}
+            )
+            for stage in stages
+        }
+
+    def select(self, targets):
+        """Names of the target stages and of all the stages they need."""
+        if not targets:
+            return list(self.stages)
+        selected, to_visit = set(), list(targets)
+        while to_visit:
+            name = to_visit.pop()
+            if name not in self.stages:
+                raise ValueError(
+                    f"Unknown stage: {name}. "
+                    f"Stages are: {', '.join(self.stages)}"
+                )
+            if name not in selected:
+                selected.add(name)
+                to_visit.extend(self.dependencies[name])
+        return [name for name in self.stages if name in selected]
+
+    def dry_run(self, targets=()):
+        """Print the stages that would run and why; return their names."""
+        to_run = []
+        for name in self.select(targets):
+            stage = self.stages[name]
+            reasons = self._reasons(stage, stage_inputs(stage, self.hasher))
+            reasons.extend(
+                f"dependency will run: {dependency}"
+                for dependency in self.dependencies[name]
+                if dependency in to_run
+            )
+            self._report(name, reasons, "would run")
+            if reasons:
+                to_run.append(name)
+        self._save_state()
+        return to_run
+
+    def run(self, targets=()):
+        """Run the stages that are out of date; return the failed ones."""
+        selected = self.select(targets)
+        done, failed, running = set(), set(), {}
+        with ThreadPoolExecutor(self.n_jobs) as executor:
+            while len(done) + len(failed) < len(selected):
+                for name in selected:
+                    if name in done or name in failed or name in running:
+                        continue
+                    dependencies = self.dependencies[name]
+                    if any(d in failed for d in dependencies):
+                        print(f"[{name}] skipped: a dependency failed")
+                        failed.add(name)
+                    elif all(d in done for d in dependencies):
+                        running[name] = executor.submit(self._run_stage, name)
+                if not running:
+                    continue
+                finished, _ = wait(
+                    running.values(), return_when=FIRST_COMPLETED
+                )
+                for name, future in list(running.items()):
+                    if future in finished:
+                        del running[name]
+                        (done if future.result() else failed).add(name)
+        self._save_state()
+        return sorted(failed)
+
+    def _run_stage(self, name):
+        stage = self.stages[name]
+        inputs = stage_inputs(stage, self.hasher)
+        reasons = self._reasons(stage, inputs)
+        self._report(name, reasons, "running")
+        if not reasons:
+            return True
+        result = subprocess.run(
+            [sys.executable, str(SCRIPTS_DIR / stage.script)], cwd=REPO_ROOT
+        )
+        if result.returncode != 0:
+            print(f"[{name}] failed with status {result.returncode}")
+            return False
+        # the inputs are hashed again: they must not have changed while the
+        # stage was running for its outputs to be considered up to date
+        with self._state_lock:
+            self.state["stages"][name] = stage_inputs(stage, self.hasher)
+        self._save_state()
+        return True
+
+    def _reasons(self, stage, inputs):
+        with self._state_lock:
+            stored_inputs = self.state["stages"].get(stage.name)
+        return rebuild_reasons(stage, inputs, stored_inputs)
+
+    def _report(self, name, reasons, action):
+        if not reasons:
+            print(f"[{name}] up to date")
+            return
+        print(f"[{name}] {action}")
+        if self.explain:
+            for reason in reasons:
+                print(f"    {reason}")
+
+    def _save_state(self):
+        with self._state_lock:
+            self.state["file_hashes"] = dict(self.hasher.known_hashes)
+            tmp_file = self.state_file.with_name(
+                f"{self.state_file.name}.tmp"
+            )
+            tmp_file.write_text(json.dumps(self.state, indent=1), "utf-8")
+            os.replace(tmp_file, self.state_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        help="Stages to build (with the stages they depend on), named after "
+        "their script, e.g. 'plot_ages'. Default is all stages.",
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="Only print the stages that would run.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--explain",
+        help="Print why each stage runs.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of stages that can run at the same time. Default is 1.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--state_file",
+        help="JSON file where the hashes of the built stages' inputs are "
+        "stored. Default is data/outputs/pipeline_state.json.",
+        type=str,
+        default=None,
+    )
+    args = parser.parse_args()
+
+    state_file = args.state_file
+    if state_file is None:
+        state_file = utils.get_outputs_dir() / "pipeline_state.json"
+    pipeline = Pipeline(
+        get_stages(),
+        state_file,
+        n_jobs=args.jobs,
+        explain=args.explain or args.dry_run,
+    )
+    if args.dry_run:
+        pipeline.dry_run(args.targets)
+        sys.exit(0)
+    failed = pipeline.run(args.targets)
+    if failed:
+        print(f"\nFailed: {', '.join(failed)}")
+        sys.exit(1)
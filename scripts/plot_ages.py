@@ -1,52 +1,63 @@
 """Plot age distribution of all participants and by category (patients/controls)."""
-import json
-
 from matplotlib import pyplot as plt
 import pandas as pd
 import seaborn as sns
 
+import demographics_table
 import utils
 
 
-age_means = []
-detailed_age_means = []
-with open(utils.get_demographics_file(), encoding="utf-8") as demo_f:
-    for article_json in demo_f:
-        article_info = json.loads(article_json)
-        age_means.append(article_info["demographics"]["age_mean"])
-        for group in article_info["demographics"]["groups"]:
-            detailed_age_means.append(
-                {
-                    "Participant type": group["participant_type"].capitalize(),
-                    "age_mean": group["age_mean"],
-                }
-            )
-detailed_age_means = pd.DataFrame(detailed_age_means).dropna()
-
-
-fig, ax = plt.subplots(figsize=(4,3))
-sns.kdeplot(
-    data=detailed_age_means,
-    x="age_mean",
-    ax=ax,
-    hue="Participant type",
-    common_norm=False,
-)
-
-ax.set_xlabel("Mean age in group of participants")
-ax.set_yticks([])
-xmin, xmax = ax.get_xlim()
-ax.set_xlim(0, xmax)
-sns.despine()
-sns.move_legend(ax, "upper right", frameon=False)
-# ax.legend(loc="upper right", frameon=False)
-
-out_dir = utils.get_figures_dir()
-fig.savefig(out_dir / f"ages_distrib_detailed.pdf", bbox_inches="tight")
-plt.close("all")
-
-
-fig, ax = plt.subplots()
-sns.histplot(x=age_means, ax=ax, kde=True, stat="probability")
-ax.set_xlabel("Mean age of study participants")
-fig.savefig(out_dir / f"ages_distrib.pdf", bbox_inches="tight")
+def load_demographics():
+    return demographics_table.load_demographics(
+        utils.get_demographics_file(),
+        article_fields=("age_mean",),
+        group_fields=("participant_type", "age_mean"),
+    )
+
+
+def make_figures(articles, groups):
+    """Return {file name: figure}."""
+    age_means = articles["age_mean"].values
+    detailed_age_means = pd.DataFrame(
+        {
+            # missing types stay NA, and are dropped below. The "string"
+            # dtype also allows the column to be all-NaN floats (e.g. when
+            # there are no groups).
+            "Participant type": groups["participant_type"]
+            .astype("string")
+            .str.capitalize(),
+            "age_mean": groups["age_mean"],
+        }
+    ).dropna()
+
+    detailed_fig, ax = plt.subplots(figsize=(4, 3))
+    sns.kdeplot(
+        data=detailed_age_means,
+        x="age_mean",
+        ax=ax,
+        hue="Participant type",
+        common_norm=False,
+    )
+
+    ax.set_xlabel("Mean age in group of participants")
+    ax.set_yticks([])
+    xmin, xmax = ax.get_xlim()
+    ax.set_xlim(0, xmax)
+    sns.despine()
+    sns.move_legend(ax, "upper right", frameon=False)
+    # ax.legend(loc="upper right", frameon=False)
+
+    fig, ax = plt.subplots()
+    sns.histplot(x=age_means, ax=ax, kde=True, stat="probability")
+    ax.set_xlabel("Mean age of study participants")
+    return {
+        "ages_distrib_detailed.pdf": detailed_fig,
+        "ages_distrib.pdf": fig,
+    }
+
+
+if __name__ == "__main__":
+    out_dir = utils.get_figures_dir()
+    for file_name, fig in make_figures(*load_demographics()).items():
+        fig.savefig(out_dir / file_name, bbox_inches="tight")
+        plt.close(fig)
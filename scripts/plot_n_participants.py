@@ -17,45 +17,59 @@ NS_NAME = "Poldrack & al. [2017]"
 DAVID_NAME = "David & al. [2013]"
 PUBGET_NAME = "pubget [in 2022]"
 
-np.random.seed(0)
-
-demographics_data = utils.load_n_participants(MIN_PAPERS).loc[
-    :, ["publication_year", "count", "n_groups"]
-]
-# restrict to single-group studies
-demographics_data = demographics_data[demographics_data["n_groups"] == 1]
-demographics_data["Data source"] = PUBGET_NAME
-neurosynth_data = utils.load_neurosynth_sample_sizes().loc[
-    :, ["publication_year", "count"]
-]
-neurosynth_data["Data source"] = NS_NAME
-david_data = utils.load_david_sample_sizes().loc[
-    :, ["publication_year", "count"]
-]
-david_data["Data source"] = DAVID_NAME
-data = pd.concat(
-    [demographics_data, neurosynth_data, david_data], axis=0, ignore_index=True
-)
-
-fig, ax = plt.subplots(figsize=(4,3))
-percentile = 50
-sns.lineplot(
-    data=data,
-    x="publication_year",
-    y="count",
-    hue="Data source",
-    hue_order=(DAVID_NAME, NS_NAME, PUBGET_NAME),
-    palette=np.asarray(utils.TAB10_COLORS[:3])[[2, 0, 1]],
-    style="Data source",
-    estimator=lambda x: np.percentile(x, percentile),
-    ax=ax,
-)
-ax.set_xlabel("Publication year")
-ax.set_ylabel("Median sample size")
-# ax.legend(loc="upper left", frameon=False)
-sns.move_legend(ax, "upper left", frameon=False)
-
-sns.despine()
-
-output_file = utils.get_figures_dir() / "n_participants.pdf"
-fig.savefig(output_file, bbox_inches="tight")
+
+def load_demographics_data():
+    # restrict to single-group studies
+    return utils.load_n_participants(
+        MIN_PAPERS,
+        columns=["publication_year", "count", "n_groups"],
+        filters=[("n_groups", "==", 1)],
+    )
+
+
+def make_figure(demographics_data, neurosynth_data, david_data):
+    np.random.seed(0)
+    demographics_data = demographics_data.loc[
+        :, ["publication_year", "count", "n_groups"]
+    ]
+    demographics_data["Data source"] = PUBGET_NAME
+    neurosynth_data = neurosynth_data.loc[:, ["publication_year", "count"]]
+    neurosynth_data["Data source"] = NS_NAME
+    david_data = david_data.loc[:, ["publication_year", "count"]]
+    david_data["Data source"] = DAVID_NAME
+    data = pd.concat(
+        [demographics_data, neurosynth_data, david_data],
+        axis=0,
+        ignore_index=True,
+    )
+
+    fig, ax = plt.subplots(figsize=(4, 3))
+    percentile = 50
+    sns.lineplot(
+        data=data,
+        x="publication_year",
+        y="count",
+        hue="Data source",
+        hue_order=(DAVID_NAME, NS_NAME, PUBGET_NAME),
+        palette=np.asarray(utils.TAB10_COLORS[:3])[[2, 0, 1]],
+        style="Data source",
+        estimator=lambda x: np.percentile(x, percentile),
+        ax=ax,
+    )
+    ax.set_xlabel("Publication year")
+    ax.set_ylabel("Median sample size")
+    # ax.legend(loc="upper left", frameon=False)
+    sns.move_legend(ax, "upper left", frameon=False)
+
+    sns.despine()
+    return fig
+
+
+if __name__ == "__main__":
+    fig = make_figure(
+        load_demographics_data(),
+        utils.load_neurosynth_sample_sizes(),
+        utils.load_david_sample_sizes(),
+    )
+    output_file = utils.get_figures_dir() / "n_participants.pdf"
+    fig.savefig(output_file, bbox_inches="tight")
@@ -0,0 +1,75 @@
+"""Token-bucket rate limiting of API requests, shared by worker threads."""
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` units per minute, in bursts up to `capacity`.
+
+    The bucket starts full; `capacity` defaults to one minute's worth.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = rate_per_minute if capacity is None else capacity
+        self.clock = clock
+        self.available = self.capacity
+        self.last_update = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.available = min(
+            self.capacity,
+            self.available + (now - self.last_update) * self.rate_per_second,
+        )
+        self.last_update = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if they are)."""
+        self._refill()
+        # larger requests than the capacity would never fit; they wait for a
+        # full bucket
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available) / self.rate_per_second)
+
+    def consume(self, amount):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Paces requests to stay under requests/min and tokens/min limits.
+
+    `acquire` blocks until both buckets allow the request. Limits that are
+    None are not enforced.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests, self.tokens = None, None
+        if requests_per_minute is not None:
+            self.requests = TokenBucket(requests_per_minute)
+        if tokens_per_minute is not None:
+            self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+
+    def acquire(self, n_requests=1, n_tokens=0):
+        """Wait until `n_requests` requests using `n_tokens` tokens can go."""
+        while True:
+            with self._lock:
+                wait = max(
+                    0.0
+                    if self.requests is None
+                    else self.requests.wait_time(n_requests),
+                    0.0
+                    if self.tokens is None
+                    else self.tokens.wait_time(n_tokens),
+                )
+                if wait == 0:
+                    if self.requests is not None:
+                        self.requests.consume(n_requests)
+                    if self.tokens is not None:
+                        self.tokens.consume(n_tokens)
+                    return
+                self.total_wait += wait
+            time.sleep(wait)
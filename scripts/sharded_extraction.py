@@ -0,0 +1,97 @@
+"""Extract demographics from a whole text.csv with a pool of processes.
+
+text.csv is read in chunks of `chunksize` rows, and each chunk is sent to a
+worker process that runs the extractor on it and writes its own shard file,
+sorted by pmcid. At most `n_jobs` chunks are in flight at a time, so memory
+stays bounded by about `chunksize` × `n_jobs` rows. Finally the shards are
+merged in pmcid order into the output file.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import heapq
+import json
+import os
+import pathlib
+import shutil
+
+import incremental_extraction
+
+
+def extract_sharded(
+    text_file,
+    output_file,
+    extract_from_dataset,
+    n_jobs=1,
+    chunksize=1000,
+    shard_dir=None,
+):
+    """Extract all rows of `text_file` into `output_file`, in pmcid order.
+
+    `extract_from_dataset` is as for
+    `incremental_extraction.extract_incrementally`; it must be picklable
+    (e.g. a module-level function). Returns [pmcid, row hash] for each
+    article, in output order.
+    """
+    output_file = pathlib.Path(output_file)
+    if shard_dir is None:
+        shard_dir = output_file.with_name(f"{output_file.name}.shards")
+    shard_dir = pathlib.Path(shard_dir)
+    if shard_dir.exists():
+        shutil.rmtree(shard_dir)
+    shard_dir.mkdir(parents=True)
+    shards, articles, pending = [], [], set()
+    with ProcessPoolExecutor(n_jobs) as executor:
+        for i, chunk in enumerate(
+            incremental_extraction.read_text_chunks(text_file, chunksize)
+        ):
+            if len(pending) >= n_jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, articles)
+            shard = shard_dir / f"shard_{i:06}.tsv"
+            shards.append(shard)
+            pending.add(
+                executor.submit(
+                    _extract_shard, chunk, shard, extract_from_dataset
+                )
+            )
+        _collect(pending, articles)
+    _merge_shards(shards, output_file)
+    shutil.rmtree(shard_dir)
+    articles.sort(key=lambda article: article[0])
+    return articles
+
+
+def _collect(futures, articles):
+    for future in futures:
+        articles.extend(future.result())
+
+
+def _extract_shard(chunk, shard_file, extract_from_dataset):
+    records = incremental_extraction.extract_batch(chunk, extract_from_dataset)
+    hashes = incremental_extraction.row_hashes(chunk)
+    pmcids = [int(pmcid) for pmcid in chunk["pmcid"]]
+    order = sorted(range(len(pmcids)), key=pmcids.__getitem__)
+    tmp_file = shard_file.with_name(f"{shard_file.name}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as shard_f:
+        # the pmcid is repeated in front of each record so that merging does
+        # not need to parse the JSON
+        for i in order:
+            shard_f.write(f"{pmcids[i]}\t{json.dumps(records[i])}\n")
+    os.replace(tmp_file, shard_file)
+    return [[pmcids[i], hashes[i]] for i in order]
+
+
+def _read_shard(shard_file):
+    with open(shard_file, encoding="utf-8") as shard_f:
+        for line in shard_f:
+            pmcid, record = line.split("\t", 1)
+            yield int(pmcid), record
+
+
+def _merge_shards(shards, output_file):
+    tmp_file = output_file.with_name(f"{output_file.name}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as output_f:
+        for _, record in heapq.merge(
+            *map(_read_shard, shards), key=lambda item: item[0]
+        ):
+            output_f.write(record)
+    os.replace(tmp_file, output_file)
@@ -8,7 +8,7 @@ import sys
 
 import pandas as pd
 
-from labelrepo import database, repo, read_json
+from labelrepo import database, repo
 from labelrepo.projects.participant_demographics import (
     get_participant_demographics,
 )
@@ -66,13 +66,16 @@ info = {
     "training_pmcids": training_pmcids_info,
 }
 
-docs_full = read_json(
-    repo.repo_root()
-    / "projects"
-    / "participant_demographics"
-    / "documents"
-    / "01_documents_00001.jsonl"
+database.make_database()
+annotations = get_participant_demographics()
+pmcids = (
+    pd.Index(utils.get_annotated_docs_pmcids())
+    .intersection(annotations["pmcid"])
+    .difference(training_pmcids_info["annotated_pmcids"])
 )
+
+# only the evaluation documents are read, through the byte offset index
+docs_full = utils.load_annotated_docs(pmcids)
 docs = pd.DataFrame(
     [
         {
@@ -88,13 +91,6 @@ docs = pd.DataFrame(
     ]
 ).set_index("pmcid")
 
-
-database.make_database()
-annotations = get_participant_demographics()
-pmcids = docs.index.intersection(annotations["pmcid"]).difference(
-    training_pmcids_info["annotated_pmcids"]
-)
-
 annotations = annotations[
     (annotations["project_name"] == "participant_demographics")
     & (annotations["annotator_name"] == "Jerome_Dockes")
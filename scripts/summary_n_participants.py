@@ -1,9 +1,15 @@
 import utils
 
-demographics_data = utils.load_n_participants(0)
-demographics_data["publication_year"] = demographics_data[
-    "publication_year"
-].dt.year
-demographics_data.to_csv(
-    utils.get_outputs_dir() / "n_participants_full_dataset.csv"
-)
+
+def make_summary(demographics_data):
+    demographics_data = demographics_data.copy()
+    demographics_data["publication_year"] = demographics_data[
+        "publication_year"
+    ].dt.year
+    return demographics_data
+
+
+if __name__ == "__main__":
+    make_summary(utils.load_n_participants(0)).to_csv(
+        utils.get_outputs_dir() / "n_participants_full_dataset.csv"
+    )
@@ -0,0 +1,21 @@
+import pathlib
+import sys
+
+import pytest
+
+# the scripts import each other as top-level modules
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "import_time: compares import times to budgets, which depends on the "
+        "machine; only runs when selected with -m import_time",
+    )
+
+
+def pytest_runtest_setup(item):
+    selected = "import_time" in (item.config.option.markexpr or "")
+    if item.get_closest_marker("import_time") and not selected:
+        pytest.skip("import times are only checked with -m import_time")
@@ -0,0 +1,59 @@
+import time
+import urllib.request
+
+import adaptive_dispatch
+import openai_stub_server
+
+
+def _post(url):
+    request = urllib.request.Request(
+        f"{url}/embeddings",
+        data=b'{"input": "text"}',
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def test_limit_grows_then_backs_off():
+    # the stub rejects requests beyond 4 at once: the limit must grow past
+    # it, be cut on the 429 errors, and every call still succeed
+    with openai_stub_server.StubServer(
+        latency=0.02, max_concurrent_requests=4, retry_after=0
+    ) as stub:
+        limits = []
+
+        def call(item):
+            limits.append(dispatcher.limit.limit)
+            return _post(stub.url)
+
+        dispatcher = adaptive_dispatch.AdaptiveDispatcher(
+            call,
+            adaptive_dispatch.AIMDLimit(initial=1, maximum=16),
+            base_delay=0.01,
+        )
+        results = []
+
+        metrics = dispatcher.run(
+            range(300), lambda item, result: results.append(item)
+        )
+    assert sorted(results) == list(range(300))
+    assert metrics["failed"] == 0
+    assert metrics["throttled"] == stub.stats["rate_limited"] > 0
+    assert max(limits) > 4
+    assert any(after < before for before, after in zip(limits, limits[1:]))
+
+
+def test_wait_before_call_is_not_latency():
+    # waiting for our own rate limiter must not look like a slow API
+    with openai_stub_server.StubServer(latency=0.01) as stub:
+        waits = iter([0.0] + [0.2] * 100)
+        limit = adaptive_dispatch.AIMDLimit(initial=1, maximum=8)
+        dispatcher = adaptive_dispatch.AdaptiveDispatcher(
+            lambda item: _post(stub.url),
+            limit,
+            before_call=lambda item: time.sleep(next(waits)),
+        )
+        dispatcher.run(range(20), lambda item, result: None)
+    assert limit.min_latency < 0.1
+    assert limit.limit > 3
@@ -0,0 +1,92 @@
+import json
+import urllib.request
+
+import pytest
+
+import gpt_extraction
+import openai_stub_server
+
+
+def _docs(n_docs):
+    return [
+        {"pmcid": pmcid, "text": f"We scanned {pmcid} participants."}
+        for pmcid in range(1, n_docs + 1)
+    ]
+
+
+def _stub_extractor(url):
+    """Send a document to the stub's chat endpoint; return its groups."""
+
+    def extract_document(doc):
+        request = urllib.request.Request(
+            f"{url}/chat/completions",
+            data=json.dumps(
+                {"messages": [{"role": "user", "content": doc["text"]}]}
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        # a 429 raises an HTTPError, retried by the dispatcher
+        with urllib.request.urlopen(request) as response:
+            answer = json.loads(response.read())
+        return json.loads(answer["choices"][0]["message"]["content"])[
+            "groups"
+        ]
+
+    return extract_document
+
+
+@pytest.fixture
+def stub(request):
+    with openai_stub_server.StubServer(
+        retry_after=0, **getattr(request, "param", {})
+    ) as server:
+        yield server
+
+
+def test_interrupted_run_resumes(stub, tmp_path):
+    checkpoint_path = tmp_path / "checkpoint.jsonl"
+    extract = _stub_extractor(stub.url)
+
+    def interrupted(doc):
+        if doc["pmcid"] > 10:
+            raise RuntimeError("interrupted")
+        return extract(doc)
+
+    stats = gpt_extraction.run_extraction(
+        _docs(20), interrupted, gpt_extraction.Checkpoint(checkpoint_path)
+    )
+    assert stats["extracted"] == 10 and stats["failed"] == 10
+    # a line being written when the run stopped
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint_f:
+        checkpoint_f.write('{"pmcid": 11, "predic')
+    n_requests = stub.stats["chat_completions"]
+
+    checkpoint = gpt_extraction.Checkpoint(checkpoint_path)
+    stats = gpt_extraction.run_extraction(_docs(20), extract, checkpoint)
+    assert stats["skipped"] == 10 and stats["extracted"] == 10
+    assert stub.stats["chat_completions"] - n_requests == 10
+    predictions = checkpoint.load_predictions()
+    assert sorted(predictions["pmcid"]) == list(range(1, 21))
+    assert (predictions["count"] == predictions["pmcid"]).all()
+
+
+@pytest.mark.parametrize("stub", [{"error_rate": 0.3}], indirect=True)
+def test_rate_limit_errors_are_retried(stub, tmp_path):
+    checkpoint = gpt_extraction.Checkpoint(tmp_path / "checkpoint.jsonl")
+    stats = gpt_extraction.run_extraction(
+        _docs(30), _stub_extractor(stub.url), checkpoint
+    )
+    assert stub.stats["rate_limited"] > 0
+    assert stats["retries"] == stub.stats["rate_limited"]
+    assert stats["failed"] == 0 and stats["extracted"] == 30
+    assert len(checkpoint) == 30
+
+
+@pytest.mark.parametrize("stub", [{"latency": 0.02}], indirect=True)
+def test_in_flight_requests_stay_under_limit(stub, tmp_path):
+    checkpoint = gpt_extraction.Checkpoint(tmp_path / "checkpoint.jsonl")
+    stats = gpt_extraction.run_extraction(
+        _docs(60), _stub_extractor(stub.url), checkpoint, max_workers=4
+    )
+    assert stats["extracted"] == 60
+    assert 1 < stub.stats["max_in_flight"] <= 4
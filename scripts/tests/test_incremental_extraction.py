@@ -0,0 +1,56 @@
+import json
+
+import pandas as pd
+
+import incremental_extraction
+
+
+def _extract_from_dataset(input_csv, output_jsonl):
+    texts = pd.read_csv(input_csv)
+    with open(output_jsonl, "w", encoding="utf-8") as output_f:
+        for pmcid, title in zip(texts["pmcid"], texts["title"]):
+            output_f.write(json.dumps({"pmcid": pmcid, "title": title}) + "\n")
+
+
+def _extract(tmp_path, articles):
+    text_file = tmp_path / "text.csv"
+    pd.DataFrame(
+        [
+            {"pmcid": pmcid, "title": title, "abstract": "12 subjects"}
+            for pmcid, title in articles.items()
+        ]
+    ).to_csv(text_file, index=False)
+    return incremental_extraction.extract_incrementally(
+        text_file,
+        tmp_path / "demographics.jsonl",
+        tmp_path / "manifest.jsonl",
+        _extract_from_dataset,
+        "extractor",
+        "1",
+        batch_size=2,
+    )
+
+
+def _output(tmp_path):
+    with open(tmp_path / "demographics.jsonl", encoding="utf-8") as output_f:
+        return {
+            record["pmcid"]: record["title"]
+            for record in map(json.loads, output_f)
+        }
+
+
+def test_removed_articles_are_dropped(tmp_path):
+    assert _extract(tmp_path, {1: "a", 2: "b", 3: "c", 4: "d", 5: "e"}) == 5
+    assert _extract(tmp_path, {1: "a", 3: "C", 5: "e"}) == 1
+    assert _output(tmp_path) == {1: "a", 3: "C", 5: "e"}
+    manifest = incremental_extraction.Manifest(
+        tmp_path / "manifest.jsonl",
+        tmp_path / "demographics.jsonl",
+        "extractor",
+        "1",
+    )
+    assert set(manifest.hashes) == {"1", "3", "5"}
+    # the rewritten output and manifest are consistent: only the new article
+    # is extracted
+    assert _extract(tmp_path, {1: "a", 3: "C", 5: "e", 6: "f"}) == 1
+    assert _output(tmp_path) == {1: "a", 3: "C", 5: "e", 6: "f"}
@@ -0,0 +1,43 @@
+"""The scripts' helpers import pandas only when they need it.
+
+See scanning_horizon/benchmarks/check_import_time.py.
+"""
+import pathlib
+import sys
+
+import pytest
+
+_REPO_DIR = pathlib.Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(_REPO_DIR / "scanning_horizon" / "benchmarks"))
+
+import check_import_time  # noqa: E402
+
+_PYTHON_PATH = [
+    str(_REPO_DIR / "scanning_horizon" / "src"),
+    str(_REPO_DIR / "scripts"),
+]
+# import statement -> budget in milliseconds. `import utils` takes about
+# 40 ms.
+BUDGETS = {
+    "import utils": 100,
+    "import jsonl_index": 50,
+}
+
+
+@pytest.mark.parametrize("statement", BUDGETS)
+def test_no_heavy_imports(statement):
+    assert not check_import_time.imported_modules(
+        statement, python_path=_PYTHON_PATH
+    )
+
+
+@pytest.mark.import_time
+def test_import_time():
+    rows, over_budget = check_import_time.check(
+        BUDGETS, repeat=5, python_path=_PYTHON_PATH
+    )
+    assert not over_budget, [
+        f"{statement}: {time_ms:.1f} ms > {budget_ms:.0f} ms"
+        for statement, time_ms, budget_ms in rows
+        if statement in over_budget
+    ]
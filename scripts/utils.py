@@ -1,16 +1,36 @@
+"""Paths and loaders shared by the scripts.
+
+pandas, and the modules that need it, are imported by the functions that
+use them, so that scripts which only need paths start quickly (see
+scanning_horizon/benchmarks/check_import_time.py).
+"""
+from __future__ import annotations
+
+import hashlib
 import json
 import pathlib
+import typing
+
+from scanning_horizon import MISSING, ExtractionCache, text_hash
 
-from matplotlib import cm
-import pandas as pd
+if typing.TYPE_CHECKING:
+    import pandas as pd
 
-from labelrepo import datasets
 
+def __getattr__(name):
+    # TAB10_COLORS is computed on first use so that scripts that do not plot
+    # do not import matplotlib
+    if name == "TAB10_COLORS":
+        from matplotlib import cm
 
-TAB10_COLORS = [cm.tab10(i) for i in range(10)]
+        globals()[name] = [cm.tab10(i) for i in range(10)]
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_pubget_data_dir():
+    from labelrepo import datasets
+
     return (
         datasets.get_project_datasets("participant_demographics")[0]
         / "subset_articlesWithCoords_extractedData"
@@ -37,70 +57,251 @@ def get_demographics_file():
     return get_outputs_dir() / "demographics.jsonl"
 
 
-def load_labelbuddy_docs():
-    data_dir = get_pubget_data_dir().parent.joinpath(
+def get_demographics_manifest_file():
+    return get_outputs_dir() / "demographics_manifest.jsonl"
+
+
+def get_cache_dir():
+    cache_dir = get_repo_data_dir() / "cache"
+    cache_dir.mkdir(exist_ok=True)
+    return cache_dir
+
+
+def get_extraction_cache(max_size_bytes=2 * 1024**3):
+    return ExtractionCache(
+        get_cache_dir() / "extraction_cache.sqlite", max_size_bytes
+    )
+
+
+def get_llm_cache_file():
+    return get_cache_dir() / "llm_cache.sqlite"
+
+
+def get_package_version(package_name):
+    """Version of an installed package, with the git commit if known.
+
+    pubextract and publang are installed from git, where the version number
+    does not change with each commit.
+    """
+    import importlib.metadata
+
+    distribution = importlib.metadata.distribution(package_name)
+    version = distribution.version
+    direct_url = distribution.read_text("direct_url.json")
+    if direct_url is not None:
+        commit = json.loads(direct_url).get("vcs_info", {}).get("commit_id")
+        if commit is not None:
+            version = f"{version}+{commit}"
+    return version
+
+
+def file_sha256(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1024**2), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def labelbuddy_doc_hash(doc):
+    return text_hash(json.dumps(doc, sort_keys=True))
+
+
+def cached_extraction(
+    cache, extractor_name, extractor_version, docs, extract_batch
+):
+    """Apply `extract_batch` to the labelbuddy docs missing from the cache.
+
+    `extract_batch` takes a list of documents and returns a list with one
+    (JSON-serializable) result per document. Returns the results for all
+    `docs`, in order.
+    """
+    keys = [labelbuddy_doc_hash(doc) for doc in docs]
+    results = [
+        cache.get(extractor_name, extractor_version, key=key) for key in keys
+    ]
+    missing = [i for i, result in enumerate(results) if result is MISSING]
+    if missing:
+        new_results = extract_batch([docs[i] for i in missing])
+        for i, result in zip(missing, new_results):
+            cache.put(extractor_name, extractor_version, result, key=keys[i])
+            results[i] = result
+    cache.commit()
+    return results
+
+
+def get_labelbuddy_data_dir():
+    return get_pubget_data_dir().parent.joinpath(
         "subset_articlesWithCoords_labelbuddyData"
     )
-    all_docs = []
-    for docs_file in sorted(data_dir.glob("doc*.jsonl")):
+
+
+def iter_labelbuddy_docs(pmcids=None):
+    """Yield labelbuddy documents one at a time, reading one line at a time.
+
+    If `pmcids` is provided, only those documents are read, using a byte
+    offset index of the shards (see `jsonl_index.py`).
+    """
+    docs_files = sorted(get_labelbuddy_data_dir().glob("doc*.jsonl"))
+    if pmcids is not None:
+        for doc in _read_indexed_docs(docs_files, pmcids):
+            yield _normalize_labelbuddy_doc(doc)
+        return
+    for docs_file in docs_files:
         with open(docs_file, encoding="utf-8") as docs_f:
             for doc_json in docs_f:
-                doc = json.loads(doc_json)
-                if "meta" in doc:
-                    doc["metadata"] = doc["meta"]
-                if "short_title" in doc:
-                    doc["display_title"] = doc["short_title"]
-                if "long_title" in doc:
-                    doc["list_title"] = doc["long_title"]
-                all_docs.append(doc)
-    return all_docs
-
-
-def load_n_participants(min_papers_per_year: int) -> pd.DataFrame:
-    metadata = pd.read_csv(
-        get_pubget_data_dir().joinpath("metadata.csv"), index_col="pmcid"
+                yield _normalize_labelbuddy_doc(json.loads(doc_json))
+
+
+def load_labelbuddy_docs(pmcids=None):
+    return list(iter_labelbuddy_docs(pmcids))
+
+
+def get_annotated_docs_file():
+    """Documents of the participant_demographics labelbuddy project."""
+    from labelrepo import repo
+
+    return (
+        repo.repo_root()
+        / "projects"
+        / "participant_demographics"
+        / "documents"
+        / "01_documents_00001.jsonl"
     )
 
-    demographics = []
-    with open(get_demographics_file(), encoding="utf8") as demo_f:
-        for article_json in demo_f:
-            article_info = json.loads(article_json)
-            article_demographics = {}
-            for key in ["count", "females_count", "males_count"]:
-                article_demographics[key] = article_info["demographics"][key]
-            article_demographics["n_groups"] = max(
-                1, len(article_info["demographics"]["groups"])
-            )
-            for group in article_info["demographics"]["groups"]:
-                article_demographics[
-                    f"{group['participant_type'].lower()}_count"
-                ] = group["count"]
-            demographics.append(article_demographics)
-
-    metadata = pd.concat(
-        [metadata, pd.DataFrame(demographics, index=metadata.index)], axis=1
+
+def get_annotated_docs_pmcids():
+    return list(_get_jsonl_index([get_annotated_docs_file()]).keys())
+
+
+def load_annotated_docs(pmcids):
+    """Load the annotation project's documents with the given pmcids."""
+    return list(_read_indexed_docs([get_annotated_docs_file()], pmcids))
+
+
+def _get_jsonl_index(jsonl_files):
+    import jsonl_index
+
+    files_id = text_hash("\n".join(str(f.resolve()) for f in jsonl_files))
+    return jsonl_index.load_index(
+        jsonl_files, get_cache_dir() / f"jsonl_index_{files_id[:16]}.json"
     )
-    metadata = metadata.dropna(subset="count")
 
-    year_counts = (
-        metadata["publication_year"]
-        .groupby(metadata["publication_year"])
-        .count()
+
+def _read_indexed_docs(jsonl_files, pmcids):
+    import jsonl_index
+
+    return jsonl_index.read_documents(_get_jsonl_index(jsonl_files), pmcids)
+
+
+def _normalize_labelbuddy_doc(doc):
+    if "meta" in doc:
+        doc["metadata"] = doc["meta"]
+    if "short_title" in doc:
+        doc["display_title"] = doc["short_title"]
+    if "long_title" in doc:
+        doc["list_title"] = doc["long_title"]
+    return doc
+
+
+def get_demographics_store_dir():
+    return get_outputs_dir() / "demographics_store"
+
+
+def build_demographics_store():
+    import demographics_table
+
+    demographics_table.write_demographics_store(
+        get_demographics_file(),
+        get_pubget_data_dir().joinpath("metadata.csv"),
+        get_demographics_store_dir(),
     )
-    good_years = year_counts[year_counts > min_papers_per_year].index
-    metadata = metadata[
-        (metadata["publication_year"] >= good_years.values.min())
-        & (metadata["publication_year"] <= good_years.values.max())
+
+
+def load_demographics_store(table="articles", columns=None, filters=None):
+    """Read from the Parquet demographics store, (re)building it if needed.
+
+    See `demographics_table.read_demographics_store` for `columns` and
+    `filters`.
+    """
+    import demographics_table
+
+    store_dir = get_demographics_store_dir()
+    sources = [
+        get_demographics_file(),
+        get_pubget_data_dir().joinpath("metadata.csv"),
     ]
-    metadata["publication_year"] = pd.to_datetime(
-        pd.DataFrame(
-            {"year": metadata["publication_year"], "month": 1, "day": 1}
-        )
+    if (
+        not store_dir.is_dir()
+        or store_dir.stat().st_mtime
+        < max(source.stat().st_mtime for source in sources)
+        or not demographics_table.is_current_store(store_dir)
+    ):
+        build_demographics_store()
+    return demographics_table.read_demographics_store(
+        store_dir, table=table, columns=columns, filters=filters
+    )
+
+
+def load_n_participants(
+    min_papers_per_year: int, columns=None, filters=None
+) -> pd.DataFrame:
+    """Articles with a known participant count, indexed by pmcid.
+
+    Only years with more than `min_papers_per_year` such articles (and the
+    years in between) are kept. `columns` and `filters` restrict what is read
+    from the store; in `filters`, "publication_year" is an integer year.
+    Articles are in the order of metadata.csv, with NaN for missing values.
+    """
+    import pandas as pd
+    import pyarrow.dataset as ds
+
+    import demographics_table
+
+    count_is_known = ds.field("count").is_valid()
+    years = load_demographics_store(
+        columns=["publication_year"], filters=count_is_known
+    )["publication_year"]
+    year_counts = years.value_counts()
+    good_years = year_counts[year_counts > min_papers_per_year].index
+    row_filter = (
+        count_is_known
+        & (ds.field("publication_year") >= good_years.values.min())
+        & (ds.field("publication_year") <= good_years.values.max())
     )
+    if filters is not None:
+        row_filter &= demographics_table.filter_expression(filters)
+    if columns is not None:
+        columns = list(dict.fromkeys(["pmcid", *columns]))
+    metadata = load_demographics_store(
+        columns=columns, filters=row_filter
+    ).set_index("pmcid")
+    if "publication_year" in metadata.columns:
+        metadata["publication_year"] = pd.to_datetime(
+            pd.DataFrame(
+                {"year": metadata["publication_year"], "month": 1, "day": 1}
+            )
+        )
     return metadata
 
 
+def select_years(n_participants, min_papers_per_year):
+    """Year selection of `load_n_participants`, on an already loaded table.
+
+    `n_participants` is the output of `load_n_participants` (with
+    "publication_year" as dates).
+    """
+    year_counts = n_participants["publication_year"].value_counts()
+    good_years = year_counts[year_counts > min_papers_per_year].index
+    return n_participants[
+        (n_participants["publication_year"] >= good_years.min())
+        & (n_participants["publication_year"] <= good_years.max())
+    ]
+
+
 def _load_scanning_horizon_sample_sizes(file_name) -> pd.DataFrame:
+    import pandas as pd
+
     data = pd.read_csv(
         get_repo_data_dir().joinpath("annotations", file_name),
         sep=" ",